@@ -0,0 +1,91 @@
+# benchmarks/bench_callable.py
+"""
+Python job throughput: `python -c` shell commands vs. callable jobs.
+
+Runs N jobs that call the same small function through worker.execute_job,
+first as shell commands of the form `python -c "import mod; mod.func()"`
+(a fresh interpreter and import per job) and then as callable jobs on a
+warm pyjobs.RunnerPool, keeping up to --parallel running at once, and
+reports jobs/sec. The database is not involved.
+
+Usage:
+    python benchmarks/bench_callable.py [--jobs N] [--parallel P]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import shlex
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from queuectl import logstore, pyjobs, worker  # noqa: E402
+
+# The job: import a module with a few stdlib dependencies and do a little work
+TASK_MODULE = """
+import json, fractions
+
+def work(n):
+    print(json.dumps({'sum': str(sum(fractions.Fraction(1, i) for i in range(1, n)))}))
+"""
+
+
+def run(jobs, parallel, make_job, runners):
+    """Runs `jobs` jobs built by make_job(i); returns jobs per second."""
+    running = []
+    
+    def finish(process, f_out, f_err):
+        process.wait()
+        if f_out:
+            f_out.close()
+            f_err.close()
+        else:
+            process.close()  # Back to the pool
+    
+    start = time.perf_counter()
+    for i in range(jobs):
+        if len(running) >= parallel:
+            finish(*running.pop(0))
+        running.append(worker.execute_job(make_job(i), 'shell', runners))
+    for item in running:
+        finish(*item)
+    return jobs / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=300, help='Jobs per mode.')
+    parser.add_argument('--parallel', type=int, default=4, help='Jobs running at once.')
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        with open('benchtask.py', 'w') as f:
+            f.write(TASK_MODULE)
+        code = shlex.quote("import benchtask; benchtask.work(50)")
+        runners = pyjobs.RunnerPool()
+        results = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            results['python -c'] = run(
+                args.jobs, args.parallel,
+                lambda i: {'id': f"shell-{i}", 'command': f"{sys.executable} -c {code}"}, runners)
+            results['callable'] = run(
+                args.jobs, args.parallel,
+                lambda i: {'id': f"call-{i}", 'command': 'benchtask:work',
+                           'callable': 'benchtask:work', 'args': '[50]'}, runners)
+        runners.close()
+        with open(logstore.job_log_paths('call-0')[0]) as f:
+            assert f.read().startswith('{"sum"'), "callable output not captured"
+    
+    print(f"{args.jobs} jobs per mode, {args.parallel} at a time")
+    for mode, rate in results.items():
+        print(f"- {mode:<9}: {rate:8,.0f} jobs/s")
+    print(f"- {'speedup':<9}: {results['callable'] / results['python -c']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
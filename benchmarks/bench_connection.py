@@ -0,0 +1,69 @@
+# benchmarks/bench_connection.py
+"""
+Per-job database overhead: pooled connection vs. connect-per-call.
+
+Runs the enqueue -> claim -> finalize cycle a worker goes through for every
+job against a scratch database, once reusing the process's cached connection
+and once closing it after every call (the pre-pool behaviour).
+
+Usage:
+    python benchmarks/bench_connection.py [--jobs N]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from queuectl import database  # noqa: E402
+
+
+def run_cycle(jobs, prefix, connect_per_call):
+    """Runs `jobs` full job cycles and returns the elapsed seconds."""
+    
+    def call(func, *args, **kwargs):
+        result = func(*args, **kwargs)
+        if connect_per_call:
+            database.close_db_connection()
+        return result
+    
+    start = time.perf_counter()
+    for i in range(jobs):
+        job_id = f"{prefix}-{i}"
+        call(database.create_job, job_id, "true")
+        job = call(database.fetch_and_lock_job)
+        call(database.finalize_job, job['id'], success=True)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=2000, help='Job cycles per mode.')
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        with contextlib.redirect_stdout(io.StringIO()):
+            database.init_db()
+        
+        results = {}
+        for mode, per_call in (('connect-per-call', True), ('pooled', False)):
+            with contextlib.redirect_stdout(io.StringIO()):
+                results[mode] = run_cycle(args.jobs, mode, per_call)
+            database.close_db_connection()
+    
+    print(f"{args.jobs} jobs per mode (enqueue + claim + finalize)")
+    for mode, elapsed in results.items():
+        per_job_us = elapsed / args.jobs * 1e6
+        print(f"- {mode:<17}: {elapsed:7.3f}s total, {per_job_us:8.1f} us/job")
+    speedup = results['connect-per-call'] / results['pooled']
+    print(f"- {'speedup':<17}: {speedup:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
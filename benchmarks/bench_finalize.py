@@ -0,0 +1,100 @@
+# benchmarks/bench_finalize.py
+"""
+Job completion throughput: one transaction per job vs. group commit.
+
+Several processes finalize pre-claimed jobs as fast as they can, the way
+workers finishing very short jobs would. In 'per-job' mode every result is
+its own transaction (finalize_job); in 'group' mode each process buffers
+results and commits them together every --window-ms (finalize_jobs), as
+`worker start --finalize-batch-ms` does.
+
+Usage:
+    python benchmarks/bench_finalize.py [--workers K] [--jobs N] [--window-ms MS]
+"""
+
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from queuectl import database  # noqa: E402
+
+
+def finalize_worker(workdir, job_ids, window):
+    """Finalizes `job_ids` one by one (window == 0) or in timed groups."""
+    os.chdir(workdir)
+    with contextlib.redirect_stdout(io.StringIO()):
+        if window <= 0:
+            for job_id in job_ids:
+                database.finalize_job(job_id, success=True)
+            return
+        
+        finished = []
+        next_flush = None
+        for job_id in job_ids:
+            if not finished:
+                next_flush = time.monotonic() + window
+            finished.append((job_id, True))
+            if time.monotonic() >= next_flush:
+                database.finalize_jobs(finished)
+                finished = []
+        database.finalize_jobs(finished)
+
+
+def run_mode(workdir, mode, workers, jobs, window):
+    """Enqueues and claims workers * jobs jobs, then times their finalization."""
+    ids = [[f"{mode}-{w}-{i}" for i in range(jobs)] for w in range(workers)]
+    rows = ((None, {'id': job_id, 'command': 'true'}) for chunk in ids for job_id in chunk)
+    database.create_jobs_bulk(rows, chunk_size=5000)
+    conn = database.get_db_connection()
+    conn.execute("UPDATE jobs SET state = 'processing' WHERE state = 'pending'")
+    conn.commit()
+    database.close_db_connection()  # Never carried into the children
+    
+    procs = [multiprocessing.Process(target=finalize_worker, args=(workdir, chunk, window))
+             for chunk in ids]
+    start = time.perf_counter()
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
+    elapsed = time.perf_counter() - start
+    
+    done = database.get_db_connection().execute(
+        "SELECT COUNT(*) FROM jobs WHERE state = 'completed' AND id LIKE ?", (f"{mode}-%",)
+    ).fetchone()[0]
+    return elapsed, done
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent finalizing processes.')
+    parser.add_argument('--jobs', type=int, default=1000, help='Jobs finalized per process.')
+    parser.add_argument('--window-ms', type=float, default=5.0, help='Group commit window.')
+    args = parser.parse_args()
+    
+    total = args.workers * args.jobs
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        with contextlib.redirect_stdout(io.StringIO()):
+            database.init_db()
+        
+        results = {}
+        for mode, window in (('per-job', 0.0), ('group', args.window_ms / 1000)):
+            results[mode] = run_mode(tmp, mode, args.workers, args.jobs, window)
+    
+    print(f"{args.workers} processes x {args.jobs} jobs, group window {args.window_ms:g} ms")
+    for mode, (elapsed, done) in results.items():
+        print(f"- {mode:<8}: {elapsed:7.3f}s, {total / elapsed:10,.0f} jobs/s ({done}/{total} completed)")
+    speedup = results['per-job'][0] / results['group'][0]
+    print(f"- {'speedup':<8}: {speedup:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+# benchmarks/bench_logs.py
+"""
+Job log storage: two files per job vs. segment files.
+
+For each log backend, writes the stdout/stderr of N jobs the way a worker
+does (open the job's log paths, write a line to each, close; for
+'segments' also SegmentWriter.store() the spool files), then reports
+jobs/sec, how many files are left under logs/, the time to read every
+log back through logstore.read_job_log and the time to delete them all.
+Index rows are inserted in batches, as group-committed finalizations would.
+
+Usage:
+    python benchmarks/bench_logs.py [--jobs N]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from queuectl import database, logstore  # noqa: E402
+
+
+def write_logs(backend, jobs):
+    """Writes `jobs` jobs' logs with `backend`; returns jobs per second."""
+    writer = logstore.SegmentWriter() if backend == 'segments' else None
+    results = []
+    start = time.perf_counter()
+    for i in range(jobs):
+        job_id = f"job-{i}"
+        out_path, err_path = logstore.job_log_paths(job_id, backend)
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        with open(out_path, 'w') as f_out, open(err_path, 'w') as f_err:
+            f_out.write(f"output of {job_id}\n")
+            f_err.write(f"warnings of {job_id}\n")
+        if writer:
+            results.append((job_id, True, writer.store(job_id)))
+            if len(results) == 500:
+                database.finalize_jobs(results)
+                results = []
+    if writer:
+        database.finalize_jobs(results)
+        writer.close()
+    return jobs / (time.perf_counter() - start)
+
+
+def run_backend(backend, jobs):
+    """Returns (write jobs/s, files left, read seconds, delete seconds)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        database.init_db()
+        rows = ((None, {'id': f"job-{i}", 'command': 'true'}) for i in range(jobs))
+        database.create_jobs_bulk(rows, chunk_size=5000)
+        while database.fetch_and_lock_jobs(5000):
+            pass  # Finalize only accepts jobs a worker holds
+        if hasattr(os, 'sync'):
+            os.sync()  # Start clean, not paying for earlier writeback
+        
+        rate = write_logs(backend, jobs)
+        files = sum(len(names) for _, _, names in os.walk(logstore.LOG_DIR))
+        
+        start = time.perf_counter()
+        for i in range(jobs):
+            assert logstore.read_job_log(f"job-{i}", 'out') == f"output of job-{i}\n"
+        read_seconds = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        shutil.rmtree(logstore.LOG_DIR)
+        delete_seconds = time.perf_counter() - start
+        
+        database.close_db_connection()
+        os.chdir(os.path.dirname(tmp))
+    return rate, files, read_seconds, delete_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=20000, help='Jobs per backend.')
+    args = parser.parse_args()
+    
+    results = {}
+    for backend in logstore.BACKENDS:
+        with contextlib.redirect_stdout(io.StringIO()):
+            results[backend] = run_backend(backend, args.jobs)
+    
+    print(f"{args.jobs} jobs per backend")
+    print(f"  {'backend':<10}{'write jobs/s':>14}{'files left':>12}{'read all':>10}{'delete all':>12}")
+    for backend, (rate, files, read_seconds, delete_seconds) in results.items():
+        print(f"  {backend:<10}{rate:>14,.0f}{files:>12,}{read_seconds:>9.2f}s{delete_seconds:>11.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# benchmarks/bench_profiles.py
+"""
+Enqueue / claim / finalize throughput under each db_profile.
+
+For every profile in database.DB_PROFILES, creates a scratch database,
+selects the profile with the 'db_profile' config key and times N single-job
+enqueues, N claims and N finalizations, each in its own transaction as the
+CLI and workers issue them.
+
+Usage:
+    python benchmarks/bench_profiles.py [--jobs N]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from queuectl import database  # noqa: E402
+
+
+def timed(func, jobs):
+    """Calls func(i) for i in range(jobs); returns operations per second."""
+    start = time.perf_counter()
+    for i in range(jobs):
+        func(i)
+    return jobs / (time.perf_counter() - start)
+
+
+def run_profile(profile, jobs):
+    """Returns {phase: ops/s} for one profile on a fresh database."""
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        database.init_db()
+        database.set_config('db_profile', profile)
+        database.close_db_connection()  # Reconnect so the profile applies
+        
+        claimed = []
+        rates = {
+            'enqueue': timed(lambda i: database.create_job(f"job-{i}", "true"), jobs),
+            'claim': timed(lambda i: claimed.append(database.fetch_and_lock_job()['id']), jobs),
+            'finalize': timed(lambda i: database.finalize_job(claimed[i], success=True), jobs),
+        }
+        database.close_db_connection()
+        os.chdir(os.path.dirname(tmp))
+    return rates
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=2000, help='Jobs per profile.')
+    args = parser.parse_args()
+    
+    results = {}
+    for profile in database.DB_PROFILES:
+        with contextlib.redirect_stdout(io.StringIO()):
+            results[profile] = run_profile(profile, args.jobs)
+    
+    print(f"{args.jobs} jobs per profile, one transaction per operation (ops/s)")
+    print(f"  {'profile':<10}{'enqueue':>12}{'claim':>12}{'finalize':>12}")
+    for profile, rates in results.items():
+        print(f"  {profile:<10}{rates['enqueue']:>12,.0f}{rates['claim']:>12,.0f}{rates['finalize']:>12,.0f}")
+
+
+if __name__ == '__main__':
+    main()
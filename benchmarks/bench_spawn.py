@@ -0,0 +1,68 @@
+# benchmarks/bench_spawn.py
+"""
+Job launch throughput: /bin/sh vs. direct exec.
+
+Starts N trivial commands through worker.execute_job with each executor,
+keeping up to --parallel of them running at once like a worker with
+--concurrency, and reports jobs/sec. Only process launch and exit are
+measured; the database is not involved.
+
+Usage:
+    python benchmarks/bench_spawn.py [--jobs N] [--parallel P] [--command CMD]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from queuectl import worker  # noqa: E402
+
+
+def run(executor, jobs, parallel, command):
+    """Runs `jobs` copies of `command`; returns jobs per second."""
+    running = []
+    start = time.perf_counter()
+    for i in range(jobs):
+        if len(running) >= parallel:
+            process, f_out, f_err = running.pop(0)
+            process.wait()
+            f_out.close()
+            f_err.close()
+        running.append(worker.execute_job({'id': f"{executor}-{i}", 'command': command}, executor))
+    for process, f_out, f_err in running:
+        process.wait()
+        f_out.close()
+        f_err.close()
+    return jobs / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=1000, help='Commands per executor.')
+    parser.add_argument('--parallel', type=int, default=8, help='Commands running at once.')
+    parser.add_argument('--command', default='true', help='Command to run (no shell syntax for spawn).')
+    args = parser.parse_args()
+    
+    direct = worker._direct_argv(args.command) is not None
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        results = {}
+        for executor in ('shell', 'spawn'):
+            with contextlib.redirect_stdout(io.StringIO()):
+                results[executor] = run(executor, args.jobs, args.parallel, args.command)
+    
+    print(f"{args.jobs} x {args.command!r}, {args.parallel} at a time"
+          f"{'' if direct else ' (needs a shell: spawn falls back to /bin/sh)'}")
+    for executor, rate in results.items():
+        print(f"- {executor:<6}: {rate:8,.0f} jobs/s")
+    print(f"- {'speedup':<6}: {results['spawn'] / results['shell']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
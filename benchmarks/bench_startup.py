@@ -0,0 +1,93 @@
+# benchmarks/bench_startup.py
+"""
+CLI startup cost: how long `queuectl enqueue` spends importing modules.
+
+Runs `python -X importtime` on the CLI module several times, reports the
+median cumulative import time of queuectl.cli and the heaviest imports,
+then times a real `queuectl enqueue` end to end against a scratch
+database. Exits non-zero if the import time exceeds the budget or if the
+CLI pulls in the web dashboard's dependencies (Flask and friends).
+
+Usage:
+    python benchmarks/bench_startup.py [--runs N] [--budget-ms MS]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only `queuectl web` may import these
+FORBIDDEN = ('flask', 'werkzeug', 'jinja2')
+
+
+def import_profile():
+    """Returns ({module: cumulative_us}) for one fresh `import queuectl.cli`."""
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import queuectl.cli'],
+        env=env, capture_output=True, text=True, check=True
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        # "import time:  self [us] | cumulative | imported package"
+        _, cumulative, name = line.split('|')
+        modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def time_enqueue(runs):
+    """Median wall-clock seconds of a `queuectl enqueue` process."""
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    samples = []
+    with tempfile.TemporaryDirectory() as workdir:
+        subprocess.run([sys.executable, '-m', 'queuectl.cli', 'init'],
+                       cwd=workdir, env=env, capture_output=True, check=True)
+        for i in range(runs):
+            start = time.perf_counter()
+            subprocess.run(
+                [sys.executable, '-m', 'queuectl.cli', 'enqueue', f'{{"id": "s{i}", "command": "true"}}'],
+                cwd=workdir, env=env, capture_output=True, check=True
+            )
+            samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--budget-ms', type=float, default=150.0,
+                        help='Maximum median import time of queuectl.cli.')
+    args = parser.parse_args()
+
+    profiles = [import_profile() for _ in range(args.runs)]
+    cli_ms = statistics.median(p['queuectl.cli'] for p in profiles) / 1000
+
+    print(f"queuectl.cli import (median of {args.runs}): {cli_ms:8.1f} ms  (budget {args.budget_ms:.0f} ms)")
+    print("Heaviest imports:")
+    last = profiles[-1]
+    for name, us in sorted(last.items(), key=lambda item: item[1], reverse=True)[1:8]:
+        print(f"  {name:<30} {us / 1000:8.1f} ms")
+    print(f"queuectl enqueue wall time (median): {time_enqueue(args.runs) * 1000:8.1f} ms")
+
+    failures = []
+    if cli_ms > args.budget_ms:
+        failures.append(f"import time {cli_ms:.1f} ms exceeds budget {args.budget_ms:.0f} ms")
+    loaded = sorted(name for name in last if name.split('.')[0] in FORBIDDEN)
+    if loaded:
+        failures.append(f"CLI imports web-only modules: {', '.join(loaded[:5])}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
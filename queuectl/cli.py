@@ -1,16 +1,21 @@
 # queuectl/cli.py
 import os
-import subprocess
 
 import click
 import json
 import signal
-import multiprocessing
+import sys
+import threading
 import time
-from . import database
-from . import worker as worker_module
-from . import dashboard
-from .config import PID_FILE, LOG_DIR
+from . import database, logstore, output
+from . import notify
+from .config import PID_FILE, LOG_DIR, SERVE_SOCKET
+
+CONFIG_KEYS = ('max_retries', 'backoff_base', 'lease_timeout', 'archive_after', 'db_profile',
+               'log_backend', 'log_segment_mb')
+
+# How often 'worker start' applies the archive_after retention policy
+RETENTION_INTERVAL = 300
 
 
 @click.group()
@@ -22,18 +27,47 @@ def cli():
 
 
 @cli.command()
-def init():
+@click.option('--shards', type=click.IntRange(min=1), default=None,
+              help='Spread jobs over this many database files (fixed once jobs exist).')
+def init(shards):
     """
     Initializes the queue database and tables.
     """
-    database.init_db()
+    database.init_db(shards)
+
+
+@cli.command()
+def migrate():
+    """
+    Upgrades an existing queue database to the current schema.
+    """
+    database.migrate_db()
+
+
+def format_option(func):
+    """Shared --format option for the listing commands."""
+    return click.option('--format', 'fmt', type=click.Choice(output.FORMATS), default='table',
+                        help='Output format: human-readable table, or jsonl/csv for tooling.')(func)
 
 
 @cli.command()
-def status():
+@click.option('--recount', is_flag=True,
+              help='Rebuild the per-state job counts from a full table scan first.')
+@format_option
+def status(recount, fmt):
     """
     Show a summary of all job states and active workers.
+
+    With --format jsonl/csv, prints one (state, count) row per state.
     """
+    if recount:
+        database.recount_jobs()
+    
+    if fmt != 'table':
+        summary = database.get_job_status_summary()
+        output.write_rows(({'state': state, 'count': count} for state, count in summary.items()), fmt)
+        return
+    
     click.echo("--- Job Status ---")
     try:
         summary = database.get_job_status_summary()
@@ -69,7 +103,8 @@ def status():
 @cli.group()
 def config():
     """
-    Manage system configuration (max-retries, backoff_base).
+    Manage system configuration (max-retries, backoff_base, lease_timeout, archive_after, db_profile,
+    log_backend, log_segment_mb).
     """
     pass
 
@@ -79,19 +114,112 @@ def config():
 @click.argument('value')
 def set_config(key, value):
     """
-    Set a configuration value (e.g., max_retries, backoff_base).
+    Set a configuration value (e.g., max_retries, backoff_base, lease_timeout).
+
+    Set archive_after (e.g. 7d) to have 'worker start' archive completed
+    and dead jobs older than that every few minutes; set it to 0 to disable.
+
+    Set db_profile to safe (default), balanced or fast to trade durability
+    for write throughput. It applies to processes started afterwards.
+
+    Set log_backend to segments to have workers started afterwards append
+    job output to rotating segment files (log_segment_mb each, default 64)
+    instead of writing two files per job; 'queuectl logs' reads both.
     """
-    if key not in ('max_retries', 'backoff_base'):
-        click.echo(f"Error: Unknown config key '{key}'. Allowed: max_retries, backoff_base")
+    if key not in CONFIG_KEYS:
+        click.echo(f"Error: Unknown config key '{key}'. Allowed: {', '.join(CONFIG_KEYS)}")
+        return
+    if key == 'archive_after':
+        try:
+            value = value if database.parse_duration(value) else ''
+        except ValueError as e:
+            click.echo(f"Error: {e}")
+            return
+    if key == 'db_profile' and value not in database.DB_PROFILES:
+        click.echo(f"Error: Unknown db_profile '{value}'. Allowed: {', '.join(database.DB_PROFILES)}")
+        return
+    if key == 'log_backend' and value not in logstore.BACKENDS:
+        click.echo(f"Error: Unknown log_backend '{value}'. Allowed: {', '.join(logstore.BACKENDS)}")
+        return
+    if key == 'log_segment_mb' and not (value.isdigit() and int(value) >= 1):
+        click.echo("Error: log_segment_mb must be a positive integer.")
         return
     database.set_config(key, value)
 
 
 # --- Enqueue Command ---
 
+def _read_jsonl(stream, errors):
+    """
+    Yields (line_number, job_dict) for each non-blank line of a JSONL stream.
+    Lines that are not valid JSON are appended to `errors` and skipped.
+    """
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except json.JSONDecodeError as e:
+            errors.append((line_no, None, f"Invalid JSON: {e}"))
+
+
+def _bulk_enqueue(stream, chunk_size):
+    """Streams jobs from a JSONL stream into the queue and reports the result."""
+    parse_errors = []
+    start_time = time.perf_counter()
+    inserted, errors = database.create_jobs_bulk(_read_jsonl(stream, parse_errors), chunk_size)
+    elapsed = time.perf_counter() - start_time
+    
+    errors = sorted(parse_errors + errors, key=lambda err: err[0])
+    for line_no, job_id, message in errors:
+        label = f" (id={job_id})" if job_id else ""
+        click.echo(f"Line {line_no}{label}: {message}", err=True)
+    
+    rate = inserted / elapsed if elapsed > 0 else 0
+    click.echo(f"Enqueued {inserted} job(s) in {elapsed:.2f}s ({rate:,.0f} jobs/s); {len(errors)} error(s).")
+
+
+def _socket_enqueue(lines, socket_path):
+    """Submits JSONL lines to a running 'queuectl serve' and reports the result."""
+    from . import server
+    
+    if not server.UNIX_SUPPORTED:
+        click.echo("Error: --via-socket needs Unix domain sockets, which this platform lacks.")
+        return
+    
+    inserted = 0
+    failed = 0
+    start_time = time.perf_counter()
+    try:
+        for line_no, reply in server.submit(lines, socket_path):
+            if reply['ok']:
+                inserted += 1
+                continue
+            failed += 1
+            label = f" (id={reply['id']})" if reply.get('id') else ""
+            click.echo(f"Line {line_no}{label}: {reply['error']}", err=True)
+    except OSError as e:
+        click.echo(f"Error: Could not reach 'queuectl serve' at {socket_path}: {e}")
+        return
+    elapsed = time.perf_counter() - start_time
+    
+    rate = inserted / elapsed if elapsed > 0 else 0
+    click.echo(f"Enqueued {inserted} job(s) in {elapsed:.2f}s ({rate:,.0f} jobs/s); {failed} error(s).")
+
+
 @cli.command()
-@click.argument('job_json_string')
-def enqueue(job_json_string):
+@click.argument('job_json_string', required=False)
+@click.option('--file', 'jobs_file', type=click.File('r'),
+              help='Enqueue every job in a JSONL file (one job object per line).')
+@click.option('--stdin', 'from_stdin', is_flag=True, help='Enqueue JSONL jobs read from stdin.')
+@click.option('--chunk-size', default=1000, type=click.IntRange(min=1),
+              help='Jobs per transaction when bulk enqueuing.')
+@click.option('--via-socket', is_flag=True,
+              help="Submit through a running 'queuectl serve' instead of opening the database.")
+@click.option('--socket', 'socket_path', default=SERVE_SOCKET, show_default=True,
+              help="Socket of the 'queuectl serve' process (with --via-socket).")
+def enqueue(job_json_string, jobs_file, from_stdin, chunk_size, via_socket, socket_path):
     """
     Add a new job to the queue.
 
@@ -102,7 +230,40 @@ def enqueue(job_json_string):
     queuectl enqueue '{"id":"job2", "command":"echo high", "priority": 10}'
     queuectl enqueue '{"id":"job3", "command":"echo later", "run_at": "2025-11-10T10:00:00Z"}'
     queuectl enqueue '{"id":"job4", "command":"/bin/false", "max_retries": 5}'
+    queuectl enqueue '{"id":"job5", "command":"./report.sh", "queue": "bulk"}'
+
+    A Python function, run in the worker's warm interpreter pool:
+    queuectl enqueue '{"id":"job6", "callable":"reports.daily:build", "args":["2025-11-10"]}'
+
+    In bulk, from a JSONL file or stdin:
+    queuectl enqueue --file jobs.jsonl
+    generate_jobs | queuectl enqueue --stdin
+
+    Through a running 'queuectl serve' (group-committed with other clients):
+    generate_jobs | queuectl enqueue --stdin --via-socket
     """
+    sources = [job_json_string is not None, jobs_file is not None, from_stdin]
+    if sum(sources) != 1:
+        click.echo("Error: Provide exactly one of JOB_JSON_STRING, --file or --stdin.")
+        return
+    
+    if via_socket:
+        if jobs_file is not None:
+            lines = jobs_file
+        elif from_stdin:
+            lines = sys.stdin
+        else:
+            lines = [job_json_string]
+        _socket_enqueue(lines, socket_path)
+        return
+    
+    if jobs_file is not None:
+        _bulk_enqueue(jobs_file, chunk_size)
+        return
+    if from_stdin:
+        _bulk_enqueue(sys.stdin, chunk_size)
+        return
+    
     try:
         job_data = json.loads(job_json_string)
     except json.JSONDecodeError:
@@ -111,9 +272,10 @@ def enqueue(job_json_string):
     
     job_id = job_data.get('id')
     command = job_data.get('command')
+    callable_spec = job_data.get('callable')
     
-    if not job_id or not command:
-        click.echo("Error: Job data must include 'id' and 'command'.")
+    if not job_id or not (command or callable_spec):
+        click.echo("Error: Job data must include 'id' and 'command' (or 'callable').")
         return
     
     # --- NEW: Get optional fields ---
@@ -121,8 +283,12 @@ def enqueue(job_json_string):
     run_at_str = job_data.get('run_at')  # Can be None
     priority = job_data.get('priority', 0)  # Default 0
     timeout = job_data.get('timeout')  # Can be None
+    queue = job_data.get('queue')  # Can be None ('default')
+    
+    args = job_data.get('args')  # Only with 'callable'
     
-    database.create_job(job_id, command, max_retries, run_at_str, priority, timeout)
+    database.create_job(job_id, command, max_retries, run_at_str, priority, timeout, queue,
+                        callable_spec, args)
 
 
 # --- Logs Command ---
@@ -133,23 +299,20 @@ def enqueue(job_json_string):
 def logs(job_id, log_type):
     """
     Show the stdout or stderr logs for a job.
-    Logs are stored in the 'logs/' directory.
+    Logs are stored in the 'logs/' directory, as per-job files or in
+    segment files (see the log_backend config key).
     """
-    # log_dir = 'logs' <-- REMOVE
-    log_suffix = 'out.log' if log_type == 'out' else 'err.log'
-    # Use the new constant
-    log_file_path = os.path.join(LOG_DIR, f"{job_id}.{log_suffix}")
-    
-    if not os.path.exists(log_file_path):
-        click.echo(f"Log file not found: {log_file_path}")
-        click.echo(f"Ensure the 'logs/' directory exists and the job has run.")
-        return
-    
     try:
-        with open(log_file_path, 'r') as f:
-            click.echo(f.read())
+        content = logstore.read_job_log(job_id, log_type)
     except Exception as e:
         click.echo(f"Error reading log file: {e}")
+        return
+    
+    if content is None:
+        click.echo(f"No {'stdout' if log_type == 'out' else 'stderr'} log found for job {job_id}.")
+        click.echo(f"Ensure the '{LOG_DIR}/' directory exists and the job has run.")
+        return
+    click.echo(content)
 
 
 # --- Worker Commands ---
@@ -164,7 +327,24 @@ def worker():
 
 @worker.command('start')
 @click.option('--count', default=1, type=int, help='Number of workers to start.')
-def start(count):
+@click.option('--prefetch', default=1, type=click.IntRange(min=1),
+              help='Jobs each worker leases per claim (buffered locally).')
+@click.option('--concurrency', default=1, type=click.IntRange(min=1),
+              help='Jobs each worker process runs at the same time.')
+@click.option('--finalize-batch-ms', default=0.0, type=click.FloatRange(min=0),
+              help='Group-commit job results every N ms instead of one transaction per job (0 = off).')
+@click.option('--db-owner', is_flag=True,
+              help='Funnel all worker writes through one DB-owner process (less lock contention).')
+@click.option('--queues', 'queues_spec', default=None,
+              help="Only take jobs from these queues, e.g. 'critical,default,bulk' "
+                   "(weights for --queue-order weighted: 'critical:6,default:3,bulk:1').")
+@click.option('--queue-order', type=click.Choice(['strict', 'weighted']), default='strict',
+              help='strict: always drain earlier queues first; weighted: pick the first queue '
+                   'at random by weight.')
+@click.option('--executor', type=click.Choice(['shell', 'spawn']), default='shell',
+              help="spawn: exec commands without shell metacharacters directly, "
+                   "skipping /bin/sh.")
+def start(count, prefetch, concurrency, finalize_batch_ms, db_owner, queues_spec, queue_order, executor):
     """
     Start one or more worker processes in the foreground.
     Manages a .pid file for 'worker stop'.
@@ -175,6 +355,17 @@ def start(count):
         click.echo("Run 'queuectl worker stop' to clear it.")
         return
     
+    import multiprocessing
+    from . import worker as worker_module
+    
+    queues = None
+    if queues_spec:
+        try:
+            queues = worker_module.parse_queues(queues_spec)
+        except ValueError as e:
+            click.echo(f"Error: {e}")
+            return
+    
     main_pid = str(os.getpid())
     shutdown_event = multiprocessing.Event()
     processes = []
@@ -185,6 +376,7 @@ def start(count):
             # Updated message to be specific
             click.echo("\n'worker stop' command (SIGTERM) received. Sending shutdown signal...")
             shutdown_event.set()
+            notify.notify_workers()  # Wake idle workers so they see the event
     
     # This line was causing the conflict.
     
@@ -192,10 +384,25 @@ def start(count):
     signal.signal(signal.SIGTERM, handle_parent_shutdown)
     # --- END FIX ---
     
-    for _ in range(count):
+    owner = None
+    backends = [None] * count
+    if db_owner:
+        from . import dbowner
+        requests = multiprocessing.Queue()
+        pipes = [multiprocessing.Pipe(duplex=False) for _ in range(count)]
+        backends = [dbowner.DBOwnerClient(requests, recv_end, index)
+                    for index, (recv_end, _) in enumerate(pipes)]
+        owner = multiprocessing.Process(
+            target=dbowner.run_db_owner,
+            args=(requests, [send_end for _, send_end in pipes])
+        )
+        owner.start()
+    
+    for backend in backends:
         proc = multiprocessing.Process(
             target=worker_module.run_worker_loop,
-            args=(shutdown_event,)
+            args=(shutdown_event, prefetch, concurrency, finalize_batch_ms / 1000, backend,
+                  queues, queue_order == 'weighted', executor)
         )
         proc.start()
         processes.append(proc)
@@ -208,8 +415,12 @@ def start(count):
         with open(PID_FILE, 'w') as f:
             f.write(main_pid)
         
+        next_retention = time.monotonic()
         while not shutdown_event.is_set():
             try:
+                if time.monotonic() >= next_retention:
+                    database.run_retention()
+                    next_retention = time.monotonic() + RETENTION_INTERVAL
                 # This sleep is interruptible by Ctrl+C
                 time.sleep(0.5)
             except KeyboardInterrupt:
@@ -218,6 +429,7 @@ def start(count):
                 if not shutdown_event.is_set():
                     click.echo("\nCtrl+C received. Sending shutdown signal...")
                     shutdown_event.set()
+                    notify.notify_workers()
                 pass  # Let the loop re-check the shutdown_event
     
     except KeyboardInterrupt:
@@ -225,12 +437,16 @@ def start(count):
         if not shutdown_event.is_set():
             click.echo("\nCtrl+C (fallback). Forcing shutdown...")
             shutdown_event.set()
+            notify.notify_workers()
         pass
     
     finally:
         click.echo(f"\nMain process {main_pid} received shutdown. Waiting for workers...")
         for p in processes:
             p.join()  # This will wait for workers to exit
+        if owner is not None:
+            requests.put(None)  # Every write is in; stop the DB owner
+            owner.join()
         
         if os.path.exists(PID_FILE):
             os.remove(PID_FILE)
@@ -263,6 +479,7 @@ def stop():
         try:
             if os.name == 'nt':
                 click.echo("Windows detected. Using 'taskkill /T /F' (forceful)...")
+                import subprocess
                 # /T - Kills the process AND any child processes.
                 # /F - Forcefully terminates the process.
                 subprocess.run(
@@ -303,25 +520,55 @@ def stop():
               type=click.Choice(['pending', 'processing', 'completed', 'failed', 'dead'], case_sensitive=False),
               default='pending',
               help='The state of jobs to list.')
-def list_jobs(state):
+@click.option('--archived', is_flag=True, help='List jobs from the archive instead.')
+@click.option('--limit', type=click.IntRange(min=1), default=None,
+              help='Show at most this many jobs (default: all, streamed).')
+@click.option('--after', type=click.IntRange(min=0), default=None,
+              help='Resume after this cursor (printed at the end of a limited listing).')
+@format_option
+def list_jobs(state, archived, limit, after, fmt):
     """
     List jobs by their state.
     """
-    jobs = database.get_jobs_by_state(state)
-    if not jobs:
-        click.echo(f"No jobs found with state: {state}")
+    try:
+        jobs = database.iter_jobs_by_state(state, after=after, limit=limit, archived=archived)
+    except ValueError as e:
+        click.echo(f"Error: {e}")
+        return
+    
+    if fmt != 'table':
+        last = {}
+        
+        def rows():
+            for last['cursor'], job in jobs:
+                yield job
+        
+        shown = output.write_rows(rows(), fmt)
+        if limit is not None and shown == limit:
+            # stderr, so the hint never ends up in the exported data
+            click.echo(f"Next page: --after {last['cursor']}", err=True)
         return
     
-    click.echo(f"--- Jobs ({state}) ---")
-    for job in jobs:
+    shown = 0
+    last_cursor = None
+    for last_cursor, job in jobs:
+        if shown == 0:
+            click.echo(f"--- {'Archived ' if archived else ''}Jobs ({state}) ---")
+        shown += 1
         click.echo(f"ID: {job['id']}")
         click.echo(f"  Command:   {job['command']}")
+        click.echo(f"  Queue:     {job['queue']}")
         click.echo(f"  State:     {job['state']}")
         click.echo(f"  Attempts:  {job['attempts']}/{job['max_retries']}")
         if job['run_at']:
-            click.echo(f"  Next Run:  {job['run_at']}")
-        click.echo(f"  Created:   {job['created_at']}")
+            click.echo(f"  Next Run:  {database.format_ts(job['run_at'])}")
+        click.echo(f"  Created:   {database.format_ts(job['created_at'])}")
         click.echo("-" * 20)
+    
+    if shown == 0:
+        click.echo(f"No {'archived ' if archived else ''}jobs found with state: {state}")
+    elif limit is not None and shown == limit:
+        click.echo(f"Next page: --after {last_cursor}")
 
 
 # --- DLQ Commands ---
@@ -335,22 +582,28 @@ def dlq():
 
 
 @dlq.command('list')
-def dlq_list():
+@format_option
+def dlq_list(fmt):
     """
     List all jobs in the Dead Letter Queue (state='dead').
     """
-    jobs = database.get_jobs_by_state('dead')
-    if not jobs:
-        click.echo("Dead Letter Queue is empty.")
+    if fmt != 'table':
+        output.write_rows((job for _, job in database.iter_jobs_by_state('dead')), fmt)
         return
     
-    click.echo("--- Dead Letter Queue Jobs ---")
-    for job in jobs:
+    shown = 0
+    for _, job in database.iter_jobs_by_state('dead'):
+        if shown == 0:
+            click.echo("--- Dead Letter Queue Jobs ---")
+        shown += 1
         click.echo(f"ID: {job['id']}")
         click.echo(f"  Command:   {job['command']}")
         click.echo(f"  Attempts:  {job['attempts']}/{job['max_retries']}")
-        click.echo(f"  Failed At: {job['updated_at']}")
+        click.echo(f"  Failed At: {database.format_ts(job['updated_at'])}")
         click.echo("-" * 20)
+    
+    if shown == 0:
+        click.echo("Dead Letter Queue is empty.")
 
 
 @dlq.command('retry')
@@ -362,12 +615,77 @@ def dlq_retry(job_id):
     database.retry_dlq_job(job_id)
 
 
+@cli.command()
+@click.option('--older-than', 'older_than', default='7d', show_default=True,
+              help='Archive jobs last updated longer ago than this (e.g. 12h, 7d, 2w).')
+@click.option('--chunk-size', default=1000, type=click.IntRange(min=1),
+              help='Jobs moved per transaction.')
+def archive(older_than, chunk_size):
+    """
+    Move old 'completed' and 'dead' jobs into the archive table.
+
+    Keeps the live jobs table small. Archived jobs can still be listed
+    with 'queuectl list --archived'.
+    """
+    try:
+        seconds = database.parse_duration(older_than)
+    except ValueError as e:
+        click.echo(f"Error: {e}")
+        return
+    count = database.archive_jobs(seconds, chunk_size)
+    click.echo(f"Archived {count} job(s) older than {older_than}.")
+
+
+@cli.command()
+@click.option('--socket', 'socket_path', default=SERVE_SOCKET, show_default=True,
+              help='Unix socket to accept submissions on.')
+@click.option('--port', type=click.IntRange(1, 65535), default=None,
+              help='Also accept submissions on 127.0.0.1:PORT.')
+@click.option('--batch-ms', default=5.0, type=click.FloatRange(min=0),
+              help='How long to gather submissions before committing them together.')
+@click.option('--max-batch', default=1000, type=click.IntRange(min=1),
+              help='Most submissions committed in one transaction.')
+def serve(socket_path, port, batch_ms, max_batch):
+    """
+    Accept NDJSON job submissions over a socket and group-commit them.
+
+    Each line is a job object as for 'enqueue' and gets one JSON reply line
+    once its transaction has committed. Submit with
+    'queuectl enqueue --via-socket', or any client that speaks NDJSON.
+    Runs in the foreground until Ctrl+C or SIGTERM.
+    """
+    from . import server
+    
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda sig, frame: stop_event.set())
+    try:
+        server.serve(socket_path, port, batch_ms / 1000, max_batch, stop_event)
+    except KeyboardInterrupt:
+        click.echo("\nCtrl+C received. Shutting down...")
+    except OSError as e:
+        click.echo(f"Error: Could not start server: {e}")
+
+
+@cli.command()
+def reaper():
+    """
+    Recover jobs stuck in 'processing' because their worker died.
+
+    Jobs whose lease expired are counted as a failed attempt and retried
+    (or moved to the DLQ). Running workers do this automatically; this
+    command is for when no workers are running.
+    """
+    count = database.reap_expired_leases()
+    click.echo(f"Recovered {count} job(s) with expired leases.")
+
+
 @cli.command()
 def web():
     """
     Start a local web dashboard to monitor the queue.
     """
     try:
+        from . import dashboard  # Flask is only needed here
         dashboard.run_web_server()
     except ImportError:
         click.echo("Error: 'flask' is not installed.")
@@ -2,3 +2,5 @@
 
 PID_FILE = '.queuectl.pids'
 LOG_DIR = 'logs'
+NOTIFY_DIR = '.queuectl.notify'
+SERVE_SOCKET = '.queuectl.sock'
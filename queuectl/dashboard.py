@@ -2,16 +2,17 @@ import json
 import os
 import subprocess
 from flask import Flask, render_template, redirect, url_for, request, jsonify
-from . import database
-from .config import PID_FILE, LOG_DIR
+from . import database, logstore
+from .config import PID_FILE
 
 app = Flask(__name__)
+app.add_template_filter(database.format_ts, 'ts')
 
 
-def get_db():
-    """Helper to get a DB connection for the web request."""
-    db = database.get_db_connection()
-    return db
+@app.teardown_appcontext
+def release_db(exception):
+    """Closes the request thread's connections before the thread exits."""
+    database.close_db_connection()
 
 
 def get_worker_status():
@@ -39,34 +40,26 @@ def api_worker_status():
 @app.route("/")
 def index():
     """Main dashboard page."""
-    db = get_db()
-    
     # Get summary
-    summary_rows = db.execute(
-        "SELECT state, COUNT(*) as count FROM jobs GROUP BY state"
-    ).fetchall()
-    summary = {row['state']: row['count'] for row in summary_rows}
+    summary = database.get_job_status_summary()
     
     # Get Config and Worker Status
     config = database.get_all_config()
     worker_status = get_worker_status()
     
     # Get 25 most recent jobs from DLQ
-    dlq_jobs = db.execute(
-        "SELECT * FROM jobs WHERE state = 'dead' ORDER BY updated_at DESC LIMIT 25"
-    ).fetchall()
+    dlq_jobs = database.get_recent_jobs(('dead',), 'updated_at', limit=25)
     
     # Get 25 most recent 'in-flight' jobs
-    inflight_jobs = db.execute(
-        "SELECT * FROM jobs WHERE state IN ('processing', 'failed', 'scheduled') ORDER BY updated_at DESC LIMIT 25"
-    ).fetchall()
+    inflight_jobs = database.get_recent_jobs(('processing', 'failed', 'scheduled'), 'updated_at', limit=25)
     
     # Get 25 most recent completed jobs
-    completed_jobs = db.execute(
-        "SELECT * FROM jobs WHERE state = 'completed' ORDER BY completed_at DESC LIMIT 25"
-    ).fetchall()
+    completed_jobs = database.get_recent_jobs(('completed',), 'completed_at', limit=25)
     
-    db.close()
+    # Archived jobs are only read on demand (?archive=1)
+    archived_jobs = None
+    if request.args.get('archive'):
+        archived_jobs = database.get_recent_archived_jobs(limit=25)
     
     return render_template(
         'dashboard.html',
@@ -75,7 +68,8 @@ def index():
         worker_status=worker_status,  # Pass initial status
         dlq_jobs=dlq_jobs,
         inflight_jobs=inflight_jobs,
-        completed_jobs=completed_jobs
+        completed_jobs=completed_jobs,
+        archived_jobs=archived_jobs
     )
 
 
@@ -122,8 +116,8 @@ def enqueue_job():
         
         job_id = job_data.get('id')
         command = job_data.get('command')
-        if not job_id or not command:
-            raise ValueError("JSON must include 'id' and 'command'")
+        if not job_id or not (command or job_data.get('callable')):
+            raise ValueError("JSON must include 'id' and 'command' (or 'callable')")
         
         database.create_job(
             job_id=job_id,
@@ -131,7 +125,10 @@ def enqueue_job():
             max_retries_override=job_data.get('max_retries'),
             run_at_str=job_data.get('run_at'),
             priority=job_data.get('priority', 0),
-            timeout=job_data.get('timeout')
+            timeout=job_data.get('timeout'),
+            queue=job_data.get('queue'),
+            callable_spec=job_data.get('callable'),
+            args=job_data.get('args')
         )
     except Exception as e:
         print(f"WEB ERROR: Failed to enqueue job: {e}")
@@ -176,19 +173,13 @@ def delete_job_route(job_id):
 @app.route("/job/logs/<job_id>")
 def view_logs(job_id):
     """Page to display stdout and stderr for a job."""
-    stdout_log = os.path.join(LOG_DIR, f"{job_id}.out.log")
-    stderr_log = os.path.join(LOG_DIR, f"{job_id}.err.log")
-    
     stdout_content = "Log not found or empty."
     stderr_content = "Log not found or empty."
     
     try:
-        if os.path.exists(stdout_log):
-            with open(stdout_log, 'r') as f:
-                stdout_content = f.read()
-        if os.path.exists(stderr_log):
-            with open(stderr_log, 'r') as f:
-                stderr_content = f.read()
+        # Per-job files or segments, whichever backend wrote them
+        stdout_content = logstore.read_job_log(job_id, 'out') or stdout_content
+        stderr_content = logstore.read_job_log(job_id, 'err') or stderr_content
     except Exception as e:
         stdout_content = f"Error reading log: {e}"
         stderr_content = f"Error reading log: {e}"
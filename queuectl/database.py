@@ -2,17 +2,63 @@
 
 import sqlite3
 import os
+import threading
+import time
+import zlib
+from contextlib import contextmanager
 from datetime import datetime, timezone, timedelta
+import functools
+import heapq
+import json
+import math
 import sys
 
+from . import notify
+
 DATABASE_FILE = 'queue.db'
 
 
-def _robust_convert_timestamp(ts_bytes):
-    """Converts an ISO-formatted timestamp from bytes to a datetime object."""
+# Version of the on-disk schema, stored in PRAGMA user_version.
+# 'queuectl migrate' upgrades older databases step by step (see _MIGRATIONS).
+SCHEMA_VERSION = 8
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def now_us():
+    """Current UTC time as integer epoch microseconds (the storage format)."""
+    return time.time_ns() // 1000
+
+
+def to_epoch_us(dt):
+    """Converts a datetime (naive means UTC) to integer epoch microseconds."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    delta = dt - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def from_epoch_us(us):
+    """Converts stored epoch microseconds back to an aware UTC datetime."""
+    if us is None:
+        return None
+    return _EPOCH + timedelta(microseconds=us)
+
+
+def format_ts(us):
+    """Formats stored epoch microseconds for display (empty string for None)."""
+    dt = from_epoch_us(us)
+    return dt.isoformat(sep=' ', timespec='seconds') if dt else ''
+
+
+def _robust_convert_timestamp(ts_value):
+    """
+    Converts a legacy ISO-formatted timestamp (str or bytes) to a datetime.
+    Only used when migrating databases that stored timestamps as text.
+    """
     try:
         # Decode bytes to string
-        ts_str = ts_bytes.decode('utf-8')
+        ts_str = ts_value.decode('utf-8') if isinstance(ts_value, bytes) else ts_value
         
         # Handle the 'Z' (Zulu/UTC) suffix if present
         if ts_str.endswith('Z'):
@@ -23,66 +69,396 @@ def _robust_convert_timestamp(ts_bytes):
             ts_str = ts_str.replace(' ', 'T', 1)
         
         return datetime.fromisoformat(ts_str)
-    except (ValueError, TypeError) as e:
-        print(f"Warning: Could not parse timestamp {ts_bytes}: {e}")
+    except (ValueError, TypeError, AttributeError) as e:
+        print(f"Warning: Could not parse timestamp {ts_value}: {e}")
         return None
 
 
-# Register our new, robust function to handle the "timestamp" type
-sqlite3.register_converter("timestamp", _robust_convert_timestamp)
+# Long-lived connections, one per process and thread. SQLite connections
+# must not cross fork() or be shared between threads, so each cached
+# connection is tagged with the pid that opened it.
+_local = threading.local()
 
+# Connections inherited from a parent process across fork(). They are kept
+# referenced (never used or closed) so the child cannot disturb the parent's
+# SQLite file locks when they would otherwise be garbage-collected.
+_inherited_connections = []
 
-def get_db_connection():
-    """Establishes a connection to the SQLite database."""
+
+# Durability/performance trade-offs, selected with the 'db_profile' config key.
+# safe:     SQLite's own defaults; every commit is fsynced (survives power loss).
+# balanced: WAL + synchronous=NORMAL; survives process crashes, but the last
+#           commits before a power loss or OS crash may be rolled back.
+# fast:     no fsyncs at all; an OS crash or power loss can corrupt the database.
+DB_PROFILES = {
+    'safe': {
+        'synchronous': 'FULL',
+        'cache_size': -2000,  # KiB when negative
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+        'wal_autocheckpoint': 1000,  # Pages
+    },
+    'balanced': {
+        'synchronous': 'NORMAL',
+        'cache_size': -16000,
+        'mmap_size': 64 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'wal_autocheckpoint': 1000,
+    },
+    'fast': {
+        'synchronous': 'OFF',
+        'cache_size': -64000,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'wal_autocheckpoint': 10000,
+    },
+}
+DEFAULT_DB_PROFILE = 'safe'
+
+
+def _apply_profile(conn, name=None):
+    """
+    Applies a db_profile's PRAGMAs to a new connection: `name`, or the
+    one configured in that database's own config table.
+    """
+    if name is None:
+        try:
+            row = conn.execute("SELECT value FROM config WHERE key = 'db_profile'").fetchone()
+        except sqlite3.Error:
+            row = None  # Not initialized yet
+        name = row[0] if row else DEFAULT_DB_PROFILE
+    if name not in DB_PROFILES:
+        print(f"Warning: Unknown db_profile '{name}', using '{DEFAULT_DB_PROFILE}'.")
+        name = DEFAULT_DB_PROFILE
+    for pragma, value in DB_PROFILES[name].items():
+        conn.execute(f"PRAGMA {pragma}={value};")
+
+
+def _open_connection(path):
+    """Opens a new connection and applies the per-connection PRAGMAs once."""
     try:
-        conn = sqlite3.connect(
-            DATABASE_FILE,
-            timeout=10.0,
-            # We still need this to *trigger* our registered converter
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
+        # Timestamps are plain integers, so no type detection is needed
+        conn = sqlite3.connect(path, timeout=10.0)
         conn.row_factory = sqlite3.Row
         conn.execute("PRAGMA journal_mode=WAL;")
-        return conn
+        if path == DATABASE_FILE:
+            _apply_profile(conn)
+        else:
+            # Shards follow the main database's configuration
+            _apply_profile(conn, get_config('db_profile', DEFAULT_DB_PROFILE))
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
     except sqlite3.Error as e:
-        print(f"FATAL: Could not connect to database at {DATABASE_FILE}: {e}")
+        print(f"FATAL: Could not connect to database at {path}: {e}")
         print("Run 'queuectl init' to create the database.")
         exit(1)
+    
+    if version < SCHEMA_VERSION and _table_exists(conn, 'jobs'):
+        print(f"FATAL: Database at {path} uses an older schema (version {version}).")
+        print("Run 'queuectl migrate' to upgrade it.")
+        exit(1)
+    return conn
 
 
-def init_db():
-    """Initializes the database and creates tables."""
-    if os.path.exists(DATABASE_FILE):
-        print(f"Database file '{DATABASE_FILE}' already exists.")
-    else:
-        print(f"Creating new database at '{DATABASE_FILE}'...")
-    
-    conn = sqlite3.connect(DATABASE_FILE)
-    cursor = conn.cursor()
+def _table_exists(conn, name):
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone()
+    return row is not None
+
+
+def get_db_connection():
+    """
+    Returns this process's (and thread's) connection to the current
+    shard (see use_shard; the main database unless sharded), opening it
+    on first use. The connection is reused by every later call, so
+    callers must not close it.
+    """
+    conns = getattr(_local, 'conns', None)
+    if conns is None or _local.pid != os.getpid():
+        if conns:
+            # We are in a forked child: leave the parent's connections alone
+            _inherited_connections.extend(conns.values())
+        conns = _local.conns = {}
+        _local.pid = os.getpid()
     
+    path = shard_path(getattr(_local, 'shard', 0))
+    conn = conns.get(path)
+    if conn is None:
+        conn = conns[path] = _open_connection(path)
+    return conn
+
+
+def close_db_connection():
+    """Closes this thread's cached connections, if it has any."""
+    conns = getattr(_local, 'conns', None)
+    if conns and _local.pid == os.getpid():
+        for conn in conns.values():
+            conn.close()
+    _local.conns = None
+
+
+# --- Sharding ---
+# With 'queuectl init --shards K', jobs are spread over K database files:
+# the main one (shard 0, which also holds the config) plus queue-1.db ...
+# queue-<K-1>.db. A job lives in the shard its id hashes to, so every
+# per-job operation is routed without a lookup, and each shard has its
+# own write lock.
+
+def shard_path(index):
+    """File name of shard `index` (shard 0 is DATABASE_FILE itself)."""
+    if index == 0:
+        return DATABASE_FILE
+    base, ext = os.path.splitext(DATABASE_FILE)
+    return f"{base}-{index}{ext}"
+
+
+def shard_count():
+    """Number of shards (config key 'shards', set once by 'queuectl init')."""
+    try:
+        return max(int(get_config('shards', 1)), 1)
+    except ValueError:
+        return 1
+
+
+def shard_for(job_id):
+    """The shard a job id lives in (stable across processes and runs)."""
+    count = shard_count()
+    if count == 1:
+        return 0
+    return zlib.crc32(str(job_id).encode()) % count
+
+
+@contextmanager
+def use_shard(index):
+    """Points get_db_connection() in this thread at shard `index`."""
+    previous = getattr(_local, 'shard', 0)
+    _local.shard = index
+    try:
+        yield
+    finally:
+        _local.shard = previous
+
+
+def _routed(func):
+    """Runs a function taking a job id first on that job's shard."""
+    @functools.wraps(func)
+    def wrapper(job_id, *args, **kwargs):
+        with use_shard(shard_for(job_id)):
+            return func(job_id, *args, **kwargs)
+    return wrapper
+
+
+def _on_every_shard(combine):
+    """Runs a function on each shard and merges the results with `combine`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            count = shard_count()
+            if count == 1:
+                return func(*args, **kwargs)
+            results = []
+            for index in range(count):
+                with use_shard(index):
+                    results.append(func(*args, **kwargs))
+            return combine(results)
+        return wrapper
+    return decorator
+
+
+def _grouped_by_shard(job_id_of, combine=None):
+    """
+    Splits a function's list argument by shard and calls it once per shard,
+    merging the results with `combine` if given (None is returned otherwise).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(items, *args, **kwargs):
+            if shard_count() == 1:
+                return func(items, *args, **kwargs)
+            groups = {}
+            for item in items:
+                groups.setdefault(shard_for(job_id_of(item)), []).append(item)
+            results = []
+            for index, group in groups.items():
+                with use_shard(index):
+                    results.append(func(group, *args, **kwargs))
+            return combine(results) if combine else None
+        return wrapper
+    return decorator
+
+
+_JOB_COUNTS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS job_counts
+    (
+        state TEXT PRIMARY KEY,
+        count INTEGER NOT NULL
+    )
+"""
+
+_RECOUNT_SQL = "INSERT INTO job_counts (state, count) SELECT state, COUNT(*) FROM jobs GROUP BY state"
+
+
+def _create_schema(cursor):
+    """Creates any missing tables, indexes and default config (idempotent)."""
     # --- Jobs Table ---
     # state: pending | processing | completed | failed | dead
     # run_at: Used for exponential backoff scheduling
+    # All *_at columns hold integer epoch microseconds (UTC)
     cursor.execute("""
                    CREATE TABLE IF NOT EXISTS jobs
                    (
                        id           TEXT PRIMARY KEY,
-                       command      TEXT      NOT NULL,
-                       state        TEXT      NOT NULL DEFAULT 'pending',
-                       attempts     INTEGER   NOT NULL DEFAULT 0,
-                       max_retries  INTEGER   NOT NULL DEFAULT 3,
-
-                       priority     INTEGER   NOT NULL DEFAULT 0,
-                       timeout      INTEGER            DEFAULT 300,
-
-                       run_at       TIMESTAMP,
-                       created_at   TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                       updated_at   TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                       started_at   TIMESTAMP,
-                       completed_at TIMESTAMP
+                       command      TEXT    NOT NULL,
+                       state        TEXT    NOT NULL DEFAULT 'pending',
+                       attempts     INTEGER NOT NULL DEFAULT 0,
+                       max_retries  INTEGER NOT NULL DEFAULT 3,
+
+                       priority     INTEGER NOT NULL DEFAULT 0,
+                       timeout      INTEGER          DEFAULT 300,
+
+                       run_at       INTEGER,
+                       created_at   INTEGER NOT NULL,
+                       updated_at   INTEGER NOT NULL,
+                       started_at   INTEGER,
+                       completed_at INTEGER,
+
+                       -- Set when claimed and extended by worker heartbeats;
+                       -- only meaningful while state = 'processing'
+                       lease_expires_at INTEGER,
+
+                       -- Named queue; workers may subscribe to a subset
+                       queue        TEXT    NOT NULL DEFAULT 'default',
+
+                       -- Python callable jobs: 'pkg.module:func' and a JSON
+                       -- argument list (command then repeats the callable);
+                       -- NULL for shell commands
+                       callable     TEXT,
+                       args         TEXT
                    )
                    """)
     
+    # --- Claim Indexes ---
+    # Shaped for fetch_and_lock_job so a claim never scans job history:
+    # - the ready queue is read straight off (state, priority, created_at)
+    # - due retries/scheduled jobs are a range scan on (state, run_at)
+    cursor.execute("""
+                   CREATE INDEX IF NOT EXISTS idx_jobs_ready
+                       ON jobs (state, priority DESC, created_at ASC)
+                   """)
+    cursor.execute("""
+                   CREATE INDEX IF NOT EXISTS idx_jobs_due
+                       ON jobs (state, run_at)
+                   """)
+    # The same two, per named queue, for workers started with --queues
+    cursor.execute("""
+                   CREATE INDEX IF NOT EXISTS idx_jobs_queue_ready
+                       ON jobs (queue, state, priority DESC, created_at ASC)
+                   """)
+    cursor.execute("""
+                   CREATE INDEX IF NOT EXISTS idx_jobs_queue_due
+                       ON jobs (queue, state, run_at)
+                   """)
+    # Lets the reaper find expired leases without a scan
+    cursor.execute("""
+                   CREATE INDEX IF NOT EXISTS idx_jobs_lease
+                       ON jobs (state, lease_expires_at)
+                   """)
+    
+    # Keyset pagination for listings: entries are ordered by (state, rowid)
+    cursor.execute("""
+                   CREATE INDEX IF NOT EXISTS idx_jobs_state
+                       ON jobs (state)
+                   """)
+    # Finds terminal jobs by age for archiving
+    cursor.execute("""
+                   CREATE INDEX IF NOT EXISTS idx_jobs_updated
+                       ON jobs (state, updated_at)
+                   """)
+    
+    # --- Job Counts ---
+    # Per-state job counts kept current by triggers on every insert, delete
+    # and state change, so status summaries never scan the jobs table
+    cursor.execute(_JOB_COUNTS_TABLE_SQL)
+    cursor.execute("""
+                   CREATE TRIGGER IF NOT EXISTS trg_jobs_count_insert
+                       AFTER INSERT ON jobs
+                   BEGIN
+                       INSERT INTO job_counts (state, count) VALUES (NEW.state, 1)
+                       ON CONFLICT (state) DO UPDATE SET count = count + 1;
+                   END
+                   """)
+    cursor.execute("""
+                   CREATE TRIGGER IF NOT EXISTS trg_jobs_count_delete
+                       AFTER DELETE ON jobs
+                   BEGIN
+                       UPDATE job_counts SET count = count - 1 WHERE state = OLD.state;
+                   END
+                   """)
+    cursor.execute("""
+                   CREATE TRIGGER IF NOT EXISTS trg_jobs_count_update
+                       AFTER UPDATE OF state ON jobs
+                       WHEN OLD.state IS NOT NEW.state
+                   BEGIN
+                       UPDATE job_counts SET count = count - 1 WHERE state = OLD.state;
+                       INSERT INTO job_counts (state, count) VALUES (NEW.state, 1)
+                       ON CONFLICT (state) DO UPDATE SET count = count + 1;
+                   END
+                   """)
+    
+    # --- Archive Table ---
+    # Cold storage for 'completed'/'dead' jobs moved out of 'jobs' by
+    # archive_jobs, so the live table only holds recent history
+    cursor.execute("""
+                   CREATE TABLE IF NOT EXISTS jobs_archive
+                   (
+                       id               TEXT PRIMARY KEY,
+                       command          TEXT    NOT NULL,
+                       state            TEXT    NOT NULL,
+                       attempts         INTEGER NOT NULL,
+                       max_retries      INTEGER NOT NULL,
+                       priority         INTEGER NOT NULL,
+                       timeout          INTEGER,
+                       run_at           INTEGER,
+                       created_at       INTEGER NOT NULL,
+                       updated_at       INTEGER NOT NULL,
+                       started_at       INTEGER,
+                       completed_at     INTEGER,
+                       lease_expires_at INTEGER,
+                       queue            TEXT    NOT NULL DEFAULT 'default',
+                       callable         TEXT,
+                       args             TEXT,
+                       archived_at      INTEGER NOT NULL
+                   )
+                   """)
+    cursor.execute("""
+                   CREATE INDEX IF NOT EXISTS idx_jobs_archive_state
+                       ON jobs_archive (state, archived_at)
+                   """)
+    cursor.execute("""
+                   CREATE INDEX IF NOT EXISTS idx_jobs_archive_list
+                       ON jobs_archive (state)
+                   """)
+    cursor.execute("""
+                   CREATE INDEX IF NOT EXISTS idx_jobs_archive_time
+                       ON jobs_archive (archived_at)
+                   """)
+    
+    # --- Job Log Index ---
+    # With the 'segments' log backend (see logstore.py) job output lives in
+    # large shared segment files; this maps each job's stdout/stderr to its
+    # byte range. It holds the job's latest run (a retry replaces it).
+    cursor.execute("""
+                   CREATE TABLE IF NOT EXISTS job_logs
+                   (
+                       job_id  TEXT    NOT NULL,
+                       stream  TEXT    NOT NULL, -- 'out' | 'err'
+                       segment TEXT    NOT NULL,
+                       offset  INTEGER NOT NULL,
+                       length  INTEGER NOT NULL,
+                       PRIMARY KEY (job_id, stream)
+                   ) WITHOUT ROWID
+                   """)
+    
     # --- Config Table ---
     # A simple key-value store for system settings
     cursor.execute("""
@@ -102,203 +478,912 @@ def init_db():
         cursor.execute("INSERT INTO config (key, value) VALUES (?, ?)", ('backoff_base', '2'))
     except sqlite3.IntegrityError:
         pass
+    try:
+        cursor.execute("INSERT INTO config (key, value) VALUES (?, ?)", ('lease_timeout', '60'))
+    except sqlite3.IntegrityError:
+        pass
+
+
+def init_db(shards=None):
+    """
+    Initializes the database and creates tables.
+
+    `shards` > 1 spreads jobs over that many database files. The shard
+    count is fixed once chosen: changing it would strand jobs in the
+    shards their ids no longer hash to.
+    """
+    if os.path.exists(DATABASE_FILE):
+        print(f"Database file '{DATABASE_FILE}' already exists.")
+    else:
+        print(f"Creating new database at '{DATABASE_FILE}'...")
     
-    conn.commit()
+    if not _init_file(DATABASE_FILE):
+        return
+    
+    conn = sqlite3.connect(DATABASE_FILE)
+    row = conn.execute("SELECT value FROM config WHERE key = 'shards'").fetchone()
+    current = int(row[0]) if row else 1
+    if shards is not None and shards != current:
+        jobs = conn.execute("SELECT EXISTS (SELECT 1 FROM jobs)").fetchone()[0]
+        if row or jobs:
+            conn.close()
+            print(f"Error: Database already uses {current} shard(s); resharding is not supported.")
+            return
+        conn.execute("INSERT OR REPLACE INTO config (key, value) VALUES ('shards', ?)", (str(shards),))
+        conn.commit()
+        current = shards
     conn.close()
+    
+    for index in range(1, current):
+        _init_file(shard_path(index))
+    if current > 1:
+        print(f"Jobs are spread over {current} shards ({DATABASE_FILE}, {shard_path(1)}, ...).")
     print("Database initialized successfully.")
 
 
+def _init_file(path):
+    """Creates the schema in one database file. Returns False if it needs migrating."""
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    
+    fresh = not _table_exists(conn, 'jobs')
+    version = cursor.execute("PRAGMA user_version").fetchone()[0]
+    if not fresh and version < SCHEMA_VERSION:
+        conn.close()
+        print(f"Database uses an older schema (version {version}, current {SCHEMA_VERSION}).")
+        print("Run 'queuectl migrate' to upgrade it.")
+        return False
+    
+    _create_schema(cursor)
+    if fresh:
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    
+    conn.commit()
+    conn.close()
+    return True
+
+
+_LEGACY_TIMESTAMP_COLUMNS = ('run_at', 'created_at', 'updated_at', 'started_at', 'completed_at')
+
+
+def _migrate_to_1(conn):
+    """Version 1: timestamps move from ISO text to integer epoch microseconds."""
+    conn.execute("DROP INDEX IF EXISTS idx_jobs_ready")
+    conn.execute("DROP INDEX IF EXISTS idx_jobs_due")
+    conn.execute("ALTER TABLE jobs RENAME TO jobs_legacy")
+    conn.execute("""
+                 CREATE TABLE jobs
+                 (
+                     id           TEXT PRIMARY KEY,
+                     command      TEXT    NOT NULL,
+                     state        TEXT    NOT NULL DEFAULT 'pending',
+                     attempts     INTEGER NOT NULL DEFAULT 0,
+                     max_retries  INTEGER NOT NULL DEFAULT 3,
+
+                     priority     INTEGER NOT NULL DEFAULT 0,
+                     timeout      INTEGER          DEFAULT 300,
+
+                     run_at       INTEGER,
+                     created_at   INTEGER NOT NULL,
+                     updated_at   INTEGER NOT NULL,
+                     started_at   INTEGER,
+                     completed_at INTEGER
+                 )
+                 """)
+    
+    def convert(value):
+        if value is None or isinstance(value, int):
+            return value
+        dt = _robust_convert_timestamp(value)
+        return to_epoch_us(dt) if dt else None
+    
+    columns = ('id', 'command', 'state', 'attempts', 'max_retries', 'priority', 'timeout',
+               *_LEGACY_TIMESTAMP_COLUMNS)
+    column_list = ', '.join(columns)
+    placeholders = ', '.join('?' * len(columns))
+    cursor = conn.execute(f"SELECT {column_list} FROM jobs_legacy ORDER BY rowid")
+    migrated = 0
+    while True:
+        rows = cursor.fetchmany(10000)
+        if not rows:
+            break
+        new_rows = []
+        for row in rows:
+            row = dict(row)
+            for column in _LEGACY_TIMESTAMP_COLUMNS:
+                row[column] = convert(row[column])
+            row['created_at'] = row['created_at'] or now_us()
+            row['updated_at'] = row['updated_at'] or row['created_at']
+            new_rows.append(tuple(row[column] for column in columns))
+        conn.executemany(f"INSERT INTO jobs ({column_list}) VALUES ({placeholders})", new_rows)
+        migrated += len(new_rows)
+    conn.execute("DROP TABLE jobs_legacy")
+    print(f"Converted timestamps for {migrated} job(s).")
+
+
+def _migrate_to_2(conn):
+    """Version 2: jobs get a lease, renewed by worker heartbeats."""
+    conn.execute("ALTER TABLE jobs ADD COLUMN lease_expires_at INTEGER")
+    # Jobs already 'processing' get a fresh lease: if no worker is
+    # actually running them, the reaper recovers them once it expires.
+    conn.execute(
+        "UPDATE jobs SET lease_expires_at = ? WHERE state = 'processing'",
+        (now_us() + DEFAULT_LEASE_TIMEOUT * 1_000_000,)
+    )
+
+
+def _migrate_to_3(conn):
+    """Version 3: adds jobs_archive; the table itself is created by _create_schema."""
+
+
+def _migrate_to_4(conn):
+    """Version 4: trigger-maintained job_counts, seeded from a full count."""
+    conn.execute(_JOB_COUNTS_TABLE_SQL)
+    conn.execute(_RECOUNT_SQL)
+
+
+def _migrate_to_5(conn):
+    """Version 5: listing indexes for keyset pagination (created by _create_schema)."""
+
+
+def _migrate_to_6(conn):
+    """Version 6: named queues; existing jobs land in 'default'."""
+    conn.execute("ALTER TABLE jobs ADD COLUMN queue TEXT NOT NULL DEFAULT 'default'")
+    if _table_exists(conn, 'jobs_archive'):
+        conn.execute("ALTER TABLE jobs_archive ADD COLUMN queue TEXT NOT NULL DEFAULT 'default'")
+
+
+def _migrate_to_7(conn):
+    """Version 7: Python callable jobs; existing jobs are shell commands."""
+    for table in ('jobs', 'jobs_archive'):
+        if _table_exists(conn, table):
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN callable TEXT")
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN args TEXT")
+
+
+def _migrate_to_8(conn):
+    """Version 8: adds the job_logs index; the table itself is created by _create_schema."""
+
+
+# Upgrade steps, keyed by the schema version they produce
+_MIGRATIONS = {
+    1: _migrate_to_1,
+    2: _migrate_to_2,
+    3: _migrate_to_3,
+    4: _migrate_to_4,
+    5: _migrate_to_5,
+    6: _migrate_to_6,
+    7: _migrate_to_7,
+    8: _migrate_to_8,
+}
+
+
+def migrate_db():
+    """Upgrades an existing database (every shard) to SCHEMA_VERSION."""
+    if not os.path.exists(DATABASE_FILE):
+        print(f"No database at '{DATABASE_FILE}'. Run 'queuectl init' to create one.")
+        return
+    
+    _migrate_file(DATABASE_FILE)
+    conn = sqlite3.connect(DATABASE_FILE)
+    try:
+        row = conn.execute("SELECT value FROM config WHERE key = 'shards'").fetchone()
+    finally:
+        conn.close()
+    for index in range(1, int(row[0]) if row else 1):
+        print(f"Shard {shard_path(index)}:")
+        _migrate_file(shard_path(index))
+
+
+def _migrate_file(path):
+    """Upgrades one database file to SCHEMA_VERSION in one transaction."""
+    # Autocommit mode, so the whole upgrade (DDL included) is one explicit transaction
+    conn = sqlite3.connect(path, timeout=10.0, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if not _table_exists(conn, 'jobs'):
+            print("Database has no jobs table. Run 'queuectl init' to create it.")
+            return
+        if version >= SCHEMA_VERSION:
+            print(f"Database schema is up to date (version {version}).")
+            return
+        
+        conn.execute("BEGIN IMMEDIATE")
+        for target in range(version + 1, SCHEMA_VERSION + 1):
+            print(f"Migrating schema to version {target}...")
+            _MIGRATIONS[target](conn)
+        _create_schema(conn.cursor())
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.execute("COMMIT")
+        print(f"Database migrated to schema version {SCHEMA_VERSION}.")
+    except sqlite3.Error as e:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        print(f"Database error migrating: {e}")
+    finally:
+        conn.close()
+
+
+# Seconds a claimed job stays leased without a worker heartbeat
+# (config key 'lease_timeout').
+DEFAULT_LEASE_TIMEOUT = 60
+
+
+# How long a process may serve config from memory before checking the
+# database for changes made by other processes ('queuectl config set').
+CONFIG_CHECK_INTERVAL = 1.0
+
+
 def set_config(key, value):
     """Sets a configuration value in the config table."""
-    conn = get_db_connection()
+    with use_shard(0):
+        conn = get_db_connection()
     try:
         conn.execute(
             "INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)",
             (key, value)
         )
         conn.commit()
+        # data_version only reflects other connections' commits
+        _local.config = None
         print(f"Config set: {key} = {value}")
     except sqlite3.Error as e:
         print(f"Database error setting config: {e}")
-    finally:
-        conn.close()
+        conn.rollback()
+
+
+def _cached_config():
+    """
+    Returns the config table as a dict, served from a per-connection cache.
+
+    At most once per CONFIG_CHECK_INTERVAL the cache is validated with
+    PRAGMA data_version, which changes whenever another connection commits,
+    and the (tiny) config table is re-read only if it did.
+    """
+    with use_shard(0):
+        conn = get_db_connection()
+    now = time.monotonic()
+    
+    if getattr(_local, 'config_conn', None) is not conn:
+        # New connection (first use, or after fork): start over
+        _local.config = None
+        _local.config_conn = conn
+    
+    if _local.config is not None and now - _local.config_checked_at < CONFIG_CHECK_INTERVAL:
+        return _local.config
+    
+    data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+    if _local.config is None or data_version != _local.config_version:
+        cursor = conn.execute("SELECT key, value FROM config")
+        _local.config = {row['key']: row['value'] for row in cursor.fetchall()}
+        _local.config_version = data_version
+    _local.config_checked_at = now
+    return _local.config
 
 
 def get_config(key, default=None):
-    """Gets a configuration value from the config table."""
-    conn = get_db_connection()
+    """Gets a configuration value from the (cached) config table."""
     try:
-        cursor = conn.execute("SELECT value FROM config WHERE key = ?", (key,))
-        row = cursor.fetchone()
-        return row['value'] if row else default
+        return _cached_config().get(key, default)
     except sqlite3.Error as e:
         print(f"Database error getting config: {e}")
         return default
-    finally:
-        conn.close()
 
 
-def create_job(job_id, command, max_retries_override=None, run_at_str=None, priority=0, timeout=None):
-    """Adds a new or scheduled job to the queue."""
+def get_lease_timeout():
+    """Returns the job lease length in seconds (config key 'lease_timeout')."""
+    value = get_config('lease_timeout', DEFAULT_LEASE_TIMEOUT)
+    try:
+        return max(int(value), 1)
+    except ValueError:
+        print(f"Warning: Invalid lease_timeout '{value}', using {DEFAULT_LEASE_TIMEOUT}.")
+        return DEFAULT_LEASE_TIMEOUT
+
+
+_INSERT_JOB_SQL = """
+    INSERT INTO jobs (id, command, max_retries, priority, timeout,
+                      created_at, updated_at, state, attempts, run_at, queue,
+                      callable, args)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, ?, ?, ?, ?)
+"""
+
+# Queue of jobs enqueued without a "queue" field
+DEFAULT_QUEUE = 'default'
+
+
+def parse_callable(command, callable_spec, args):
+    """
+    Resolves a job's 'command' / 'callable' / 'args' fields into the
+    (command, callable, args_json) columns. A callable job is stored with
+    its 'pkg.module:func' spec as its command too, so listings show it.
+    Raises ValueError if the fields are inconsistent.
+    """
+    if callable_spec is None:
+        if args is not None:
+            raise ValueError("'args' is only valid with 'callable'.")
+        if command is not None and not isinstance(command, str):
+            raise ValueError("'command' must be a string.")
+        return command, None, None
+    if command:
+        raise ValueError("Give either 'command' or 'callable', not both.")
+    if not isinstance(callable_spec, str):
+        raise ValueError("'callable' must be a string.")
+    module, _, func = callable_spec.partition(':')
+    if not module or not func:
+        raise ValueError("'callable' must look like 'package.module:function'.")
+    if args is None:
+        args = []
+    if not isinstance(args, list):
+        raise ValueError("'args' must be a JSON array.")
+    return callable_spec, callable_spec, json.dumps(args)
+
+
+def _parse_run_at(run_at_str, now):
+    """
+    Resolves a job's optional run_at string into (state, run_at), where
+    run_at is epoch microseconds. `now` is epoch microseconds too.
+    Raises ValueError if the string is not ISO 8601.
+    """
+    if not run_at_str:
+        return 'pending', None
+    
+    run_at_dt_aware = datetime.fromisoformat(run_at_str)
+    
+    # 1. Check if user provided a "naive" time (no timezone)
+    if run_at_dt_aware.tzinfo is None:
+        # If naive, assume it's the user's LOCAL time.
+        # Stamp it with the system's local timezone.
+        run_at_dt_aware = run_at_dt_aware.replace(tzinfo=datetime.now().astimezone().tzinfo)
+    
+    # 2. Now that the datetime is "aware", convert it to UTC
+    #    for consistent database storage.
+    run_at_us = to_epoch_us(run_at_dt_aware.astimezone(timezone.utc))
+    
+    if run_at_us > now:
+        return 'scheduled', run_at_us  # This is the UTC time to save
+    # Time is in the past, run it now
+    return 'pending', None
+
+
+@_routed
+def create_job(job_id, command, max_retries_override=None, run_at_str=None, priority=0, timeout=None,
+               queue=None, callable_spec=None, args=None):
+    """
+    Adds a new or scheduled job to the queue (to the named `queue`, or
+    'default'). With `callable_spec` ('pkg.module:func') and `args`, the job
+    is a Python callable run in-process by the worker; pass command=None.
+    """
     conn = get_db_connection()
     
     try:
+        queue = queue or DEFAULT_QUEUE
+        if not isinstance(queue, str):
+            print("Error: 'queue' must be a string.")
+            return
+        
+        try:
+            command, callable_spec, args_json = parse_callable(command, callable_spec, args)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+        
         if max_retries_override is None:
             default_retries = get_config('max_retries', 3)
             max_retries = int(default_retries)
         else:
             max_retries = int(max_retries_override)
         
-        if timeout is None:
-            timeout = 300  # Default timeout
+        try:
+            priority = int(priority)
+            timeout = 300 if timeout is None else int(timeout)  # Default timeout
+        except (TypeError, ValueError):
+            print("Error: 'priority' and 'timeout' must be integers.")
+            return
         
-        now = datetime.now(timezone.utc)
-        job_state = 'pending'
-        run_at_dt = None
+        now = now_us()
         
-        # --- MODIFIED: Correct Scheduling Logic ---
-        if run_at_str:
-            try:
-                run_at_dt_aware = datetime.fromisoformat(run_at_str)
-                
-                # 1. Check if user provided a "naive" time (no timezone)
-                if run_at_dt_aware.tzinfo is None:
-                    # If naive, assume it's the user's LOCAL time.
-                    # Stamp it with the system's local timezone.
-                    run_at_dt_aware = run_at_dt_aware.replace(tzinfo=datetime.now().astimezone().tzinfo)
-                
-                # 2. Now that the datetime is "aware", convert it to UTC
-                #    for consistent database storage.
-                run_at_dt_utc = run_at_dt_aware.astimezone(timezone.utc)
-                
-                if run_at_dt_utc > now:
-                    job_state = 'scheduled'
-                    run_at_dt = run_at_dt_utc  # This is the UTC time to save
-                    print(f"Job {job_id} is scheduled to run at {run_at_dt}")
-                else:
-                    # Time is in the past, run it now
-                    job_state = 'pending'
-                    run_at_dt = None
-            
-            except ValueError:
-                print(
-                    f"Error: Invalid run_at format '{run_at_str}'. Must be ISO 8601 (e.g., YYYY-MM-DDTHH:MM:SS+HH:MM).")
-                return
-        # --- END MODIFIED LOGIC ---
+        try:
+            job_state, run_at_us = _parse_run_at(run_at_str, now)
+        except ValueError:
+            print(
+                f"Error: Invalid run_at format '{run_at_str}'. Must be ISO 8601 (e.g., YYYY-MM-DDTHH:MM:SS+HH:MM).")
+            return
+        if job_state == 'scheduled':
+            print(f"Job {job_id} is scheduled to run at {format_ts(run_at_us)}")
         
         conn.execute(
-            """
-            INSERT INTO jobs (id, command, max_retries, priority, timeout,
-                              created_at, updated_at, state, attempts, run_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, ?)
-            """,
+            _INSERT_JOB_SQL,
             (job_id, command, max_retries, priority, timeout,
-             now, now, job_state, run_at_dt)
+             now, now, job_state, run_at_us, queue, callable_spec, args_json)
         )
         conn.commit()
+        notify.notify_workers()
         if job_state == 'pending':
             print(f"Successfully enqueued job: {job_id}")
     
     except sqlite3.IntegrityError:
         print(f"Error: Job with ID '{job_id}' already exists.")
+        conn.rollback()
     except Exception as e:
         print(f"Error enqueuing job: {e}")
-    finally:
-        conn.close()
+        conn.rollback()
+
+
+def _job_row(job_data, now, default_retries):
+    """
+    Validates one job dict (as accepted by 'queuectl enqueue') and
+    returns its INSERT parameters. Raises ValueError if it is invalid.
+    """
+    if not isinstance(job_data, dict):
+        raise ValueError("Job must be a JSON object.")
+    
+    job_id = job_data.get('id')
+    command, callable_spec, args_json = parse_callable(
+        job_data.get('command'), job_data.get('callable'), job_data.get('args'))
+    if not job_id or not command:
+        raise ValueError("Job data must include 'id' and 'command' (or 'callable').")
+    if not isinstance(job_id, str):
+        raise ValueError("'id' must be a string.")
+    
+    max_retries = job_data.get('max_retries')
+    try:
+        max_retries = default_retries if max_retries is None else int(max_retries)
+        priority = int(job_data.get('priority', 0))
+        timeout = job_data.get('timeout')
+        timeout = 300 if timeout is None else int(timeout)
+    except (TypeError, ValueError):
+        raise ValueError("'max_retries', 'priority' and 'timeout' must be integers.")
+    
+    run_at_str = job_data.get('run_at')
+    try:
+        job_state, run_at_us = _parse_run_at(run_at_str, now)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid run_at format '{run_at_str}'. Must be ISO 8601.")
+    
+    queue = job_data.get('queue') or DEFAULT_QUEUE
+    if not isinstance(queue, str):
+        raise ValueError("'queue' must be a string.")
+    
+    return (job_id, command, max_retries, priority, timeout,
+            now, now, job_state, run_at_us, queue, callable_spec, args_json)
+
+
+def validate_job(job_data):
+    """
+    Checks one job dict the way create_jobs_bulk() will, without touching
+    the database. Raises ValueError if it would be rejected.
+    """
+    _job_row(job_data, now_us(), 0)
+
+
+def create_jobs_bulk(jobs, chunk_size=1000):
+    """
+    Inserts many jobs, committing one transaction per chunk.
+
+    `jobs` is an iterable of (ref, job_dict) pairs, where ref identifies the
+    row in error reports (e.g. a line number). It is consumed lazily, so a
+    large file is never held in memory. Invalid rows and duplicate IDs are
+    reported and skipped without aborting the rest of the batch.
+
+    Returns a tuple of (inserted_count, errors), where errors is a list
+    of (ref, job_id, message).
+    """
+    default_retries = int(get_config('max_retries', 3))
+    shards = shard_count()
+    inserted = 0
+    errors = []
+    
+    def flush(shard, chunk):
+        with use_shard(shard):
+            conn = get_db_connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("SAVEPOINT bulk_chunk")
+            try:
+                conn.executemany(_INSERT_JOB_SQL, [row for _, row in chunk])
+                count = len(chunk)
+            except sqlite3.Error:
+                # A bad row (usually a duplicate) somewhere in the chunk.
+                # Rows before it were already inserted, so undo the whole
+                # executemany and insert row by row to isolate the offenders.
+                conn.execute("ROLLBACK TO bulk_chunk")
+                count = 0
+                for ref, row in chunk:
+                    try:
+                        conn.execute(_INSERT_JOB_SQL, row)
+                        count += 1
+                    except sqlite3.IntegrityError:
+                        errors.append((ref, row[0], f"Job with ID '{row[0]}' already exists."))
+                    except sqlite3.Error as e:
+                        errors.append((ref, row[0], f"Not inserted: {e}"))
+            conn.commit()
+            notify.notify_workers()
+            return count
+        except sqlite3.Error as e:
+            print(f"Database error in bulk enqueue: {e}")
+            conn.rollback()
+            errors.extend((ref, row[0], f"Not inserted: {e}") for ref, row in chunk)
+            return 0
+    
+    chunks = {}  # shard -> pending rows
+    for ref, job_data in jobs:
+        try:
+            row = _job_row(job_data, now_us(), default_retries)
+        except ValueError as e:
+            job_id = job_data.get('id') if isinstance(job_data, dict) else None
+            errors.append((ref, job_id, str(e)))
+            continue
+        shard = shard_for(row[0]) if shards > 1 else 0
+        chunk = chunks.setdefault(shard, [])
+        chunk.append((ref, row))
+        if len(chunk) >= chunk_size:
+            inserted += flush(shard, chunk)
+            del chunks[shard]
+    for shard, chunk in chunks.items():
+        inserted += flush(shard, chunk)
+    
+    return inserted, errors
+
+
+# Ids of the next jobs to claim, best first.
+# Each branch of the UNION is a LIMIT lookup on its own index
+# (idx_jobs_ready / idx_jobs_due), so the cost of a claim does not
+# grow with the number of completed or dead jobs in the table.
+# 1. Best 'pending' jobs, plus the best due 'failed'/'scheduled' ones
+# 2. Order by priority (highest first), then by creation time (oldest first)
+_NEXT_JOB_IDS_TEMPLATE = """
+    SELECT id
+    FROM (SELECT id, priority, created_at
+          FROM (SELECT id, priority, created_at
+                FROM jobs
+                WHERE {queue_filter}state = 'pending'
+                ORDER BY priority DESC, created_at ASC
+                LIMIT :limit)
+          UNION ALL
+          SELECT id, priority, created_at
+          FROM (SELECT id, priority, created_at
+                FROM jobs
+                WHERE {queue_filter}state = 'failed' AND run_at <= :now
+                ORDER BY priority DESC, created_at ASC
+                LIMIT :limit)
+          UNION ALL
+          SELECT id, priority, created_at
+          FROM (SELECT id, priority, created_at
+                FROM jobs
+                WHERE {queue_filter}state = 'scheduled' AND run_at <= :now
+                ORDER BY priority DESC, created_at ASC
+                LIMIT :limit)
+          ORDER BY priority DESC, created_at ASC
+          LIMIT :limit)
+"""
+_NEXT_JOB_IDS_SQL = _NEXT_JOB_IDS_TEMPLATE.format(queue_filter='')
+# Same, restricted to one named queue (idx_jobs_queue_ready / idx_jobs_queue_due)
+_NEXT_QUEUE_JOB_IDS_SQL = _NEXT_JOB_IDS_TEMPLATE.format(queue_filter='queue = :queue AND ')
+
+# UPDATE ... RETURNING needs SQLite 3.35+; older builds take the
+# SELECT-then-UPDATE path in fetch_and_lock_job.
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
 
 
 def fetch_and_lock_job():
     """
-    Atomically fetches the next available job (by priority)
-    and marks it as 'processing'.
+    Atomically fetches the next available job (by priority),
+    marks it as 'processing' and stamps started_at, in a single
+    write transaction.
+    """
+    jobs = fetch_and_lock_jobs(1)
+    return jobs[0] if jobs else None
+
+
+def fetch_and_lock_jobs(limit, queues=None, start_now=None):
+    """
+    Atomically leases up to `limit` available jobs (by priority) in a
+    single write transaction, marking them all as 'processing'. Each
+    lease lasts 'lease_timeout' seconds unless renewed by extend_leases.
+
+    Only the best `start_now` jobs (all by default) get started_at
+    stamped; the caller is about to run those. The rest are prefetched
+    into a worker's buffer and keep started_at NULL until they actually
+    run (the worker reports their start time with their result).
+
+    With `queues` (a list of queue names), only jobs in those queues are
+    claimed, strictly in the given order: a later queue is only tried if
+    the earlier ones have fewer than `limit` ready jobs.
+
+    When sharded, each call starts at the next shard in turn (offset by
+    pid, so workers spread out) and steals from the following shards if
+    that one has fewer than `limit` ready jobs. Priority is then honoured
+    within a shard, not across shards.
+
+    Returns a list of job dicts, best first (empty if none are ready).
+    """
+    count = shard_count()
+    if count == 1:
+        return _claim_from_queues(limit, queues, start_now)
+    
+    start = getattr(_local, 'claim_shard', os.getpid())
+    _local.claim_shard = start + 1
+    jobs = []
+    for offset in range(count):
+        with use_shard((start + offset) % count):
+            jobs.extend(_claim_from_queues(limit - len(jobs), queues, _still_to_start(start_now, jobs)))
+        if len(jobs) >= limit:
+            break
+    return jobs
+
+
+def _still_to_start(start_now, jobs):
+    """How many of the next claimed jobs start now, after `jobs` were claimed."""
+    return None if start_now is None else max(start_now - len(jobs), 0)
+
+
+def _claim_from_queues(limit, queues, start_now=None):
+    """Claims from `queues` in order (any queue if None) on the current shard."""
+    if not queues:
+        return _claim_jobs(limit, None, start_now)
+    jobs = []
+    for queue in queues:
+        jobs.extend(_claim_jobs(limit - len(jobs), queue, _still_to_start(start_now, jobs)))
+        if len(jobs) >= limit:
+            break
+    return jobs
+
+
+def _claim_rank(job):
+    """
+    Sort key giving claimed jobs the order of _NEXT_JOB_IDS_SQL (priority
+    DESC, created_at). Rows from before priorities were validated may hold
+    text, which SQLite sorts above any number.
     """
+    priority = job['priority']
+    if isinstance(priority, (int, float)):
+        return (1, -priority, job['created_at'])
+    return (0, 0, job['created_at'])
+
+
+def _claim_jobs(limit, queue=None, start_now=None):
+    """One claim transaction on the current shard, optionally for one queue."""
     conn = get_db_connection()
     try:
         conn.execute("BEGIN IMMEDIATE")
         
-        now = datetime.now(timezone.utc)
+        now = now_us()
+        lease_expires_at = now + get_lease_timeout() * 1_000_000
+        params = {'now': now, 'limit': limit, 'lease_expires_at': lease_expires_at, 'queue': queue}
+        next_ids_sql = _NEXT_JOB_IDS_SQL if queue is None else _NEXT_QUEUE_JOB_IDS_SQL
+        
+        if _HAS_RETURNING:
+            # Select, lock and mark started in one statement
+            cursor = conn.execute(
+                f"""
+                UPDATE jobs
+                SET state            = 'processing',
+                    started_at       = :now,
+                    updated_at       = :now,
+                    lease_expires_at = :lease_expires_at
+                WHERE id IN ({next_ids_sql})
+                RETURNING *
+                """,
+                params
+            )
+            jobs = [dict(row) for row in cursor.fetchall()]
+        else:
+            cursor = conn.execute(
+                f"SELECT * FROM jobs WHERE id IN ({next_ids_sql})",
+                params
+            )
+            jobs = [dict(row) for row in cursor.fetchall()]
+            for job in jobs:
+                job.update(state='processing', started_at=now, updated_at=now,
+                           lease_expires_at=lease_expires_at)
+            conn.executemany(
+                """
+                UPDATE jobs
+                SET state            = 'processing',
+                    started_at       = ?,
+                    updated_at       = ?,
+                    lease_expires_at = ?
+                WHERE id = ?
+                """,
+                [(now, now, lease_expires_at, job['id']) for job in jobs]
+            )
+        
+        # RETURNING does not preserve the subquery's order
+        jobs.sort(key=_claim_rank)
+        if start_now is not None and start_now < len(jobs):
+            # Prefetched, not started: no start time until they run
+            buffered = jobs[start_now:]
+            conn.executemany("UPDATE jobs SET started_at = NULL WHERE id = ?",
+                             [(job['id'],) for job in buffered])
+            for job in buffered:
+                job['started_at'] = None
         
-        # --- MODIFIED: WHERE and ORDER BY ---
-        # 1. Look for 'pending' OR 'failed'/'scheduled' that are ready to run
-        # 2. Order by priority (highest first), then by creation time (oldest first)
+        conn.commit()
+        return jobs
+    
+    except sqlite3.Error as e:
+        print(f"Database error fetching jobs: {e}")
+        conn.rollback()
+        return []
+    except BaseException:
+        conn.rollback()  # Never leave the connection inside a transaction
+        raise
+
+
+@_grouped_by_shard(lambda job_id: job_id, sum)
+def extend_leases(job_ids):
+    """
+    Heartbeat: renews the leases of jobs this worker still holds.
+    Returns the number of leases extended.
+    """
+    if not job_ids:
+        return 0
+    conn = get_db_connection()
+    lease_expires_at = now_us() + get_lease_timeout() * 1_000_000
+    job_ids = list(job_ids)
+    try:
         cursor = conn.execute(
+            f"""
+            UPDATE jobs
+            SET lease_expires_at = ?
+            WHERE state = 'processing'
+              AND id IN ({', '.join('?' * len(job_ids))})
+            """,
+            (lease_expires_at, *job_ids)
+        )
+        conn.commit()
+        return cursor.rowcount
+    except sqlite3.Error as e:
+        print(f"Database error extending leases: {e}")
+        conn.rollback()
+        return 0
+
+
+@_on_every_shard(sum)
+def reap_expired_leases():
+    """
+    Recovers 'processing' jobs whose lease expired because their worker
+    died without releasing them (SIGKILL, OOM, forced stop). Each one
+    counts as a failed attempt: it is made due for retry immediately,
+    or moved to the DLQ if it has no retries left.
+
+    Returns the number of jobs recovered.
+    """
+    conn = get_db_connection()
+    now = now_us()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        # Range scan on idx_jobs_lease
+        expired = conn.execute(
             """
-            SELECT *
+            SELECT id, attempts, max_retries
             FROM jobs
-            WHERE (state = 'pending')
-               OR (state IN ('failed', 'scheduled') AND run_at <= ?)
-            ORDER BY priority DESC, created_at ASC
-            LIMIT 1
+            WHERE state = 'processing'
+              AND lease_expires_at < ?
             """,
             (now,)
-        )
-        job = cursor.fetchone()
+        ).fetchall()
         
-        if job:
+        for job in expired:
+            new_attempts = job['attempts'] + 1
+            new_state = 'dead' if new_attempts >= job['max_retries'] else 'failed'
+            print(f"Reaper: Job {job['id']} lease expired. Marking '{new_state}' "
+                  f"(attempt {new_attempts}/{job['max_retries']}).")
             conn.execute(
                 """
                 UPDATE jobs
-                SET state      = 'processing',
-                    updated_at = ?
+                SET state      = ?,
+                    attempts   = ?,
+                    updated_at = ?,
+                    run_at     = ?
                 WHERE id = ?
                 """,
-                (now, job['id'])
+                (new_state, new_attempts, now, now, job['id'])
             )
-            conn.commit()
-            return dict(job)
-        else:
-            conn.commit()
-            return None
+        conn.commit()
+        if expired:
+            notify.notify_workers()
+        return len(expired)
     
     except sqlite3.Error as e:
-        print(f"Database error fetching job: {e}")
+        print(f"Database error reaping expired leases: {e}")
         conn.rollback()
-        return None
-    finally:
-        conn.close()
+        return 0
 
 
-def finalize_job(job_id, success):
+def finalize_job(job_id, success, logs=None, started_at=None, claimed_at=None):
     """
     Finalizes a job by marking it 'completed' or handling failure
     with exponential backoff and DLQ logic.
     """
+    finalize_jobs([(job_id, success, logs, started_at, claimed_at)])
+
+
+@_grouped_by_shard(lambda result: result[0])
+def finalize_jobs(results):
+    """
+    Finalizes several finished jobs in one write transaction (group commit).
+
+    `results` is a list of (job_id, success) pairs. Each job gets exactly
+    the treatment finalize_job() would give it, but the batch costs a
+    single transaction and fsync, which is what caps completion throughput
+    when many workers finish short jobs.
+
+    A result may carry a third item: the job's log segment entries,
+    [(stream, segment, offset, length), ...] (see logstore.py), which are
+    indexed in the same transaction; a fourth: the start time of a
+    prefetched job, whose claim left started_at unset; and a fifth: the
+    updated_at stamp its claim returned.
+    
+    Only a job still 'processing' under that claim is finalized. A worker
+    that stalled past its lease reports a result for a job the reaper has
+    since taken back, possibly re-claimed by another worker; that result
+    is dropped rather than overwriting the new claim.
+    """
+    if not results:
+        return
     conn = get_db_connection()
-    now = datetime.now(timezone.utc)
+    now = now_us()
     
     try:
-        if success:
-            # --- Happy Path ---
-            conn.execute(
+        conn.execute("BEGIN IMMEDIATE")  # Lock for read-modify-write
+        backoff_base = None
+        retrying = False
+        for job_id, success, *extra in results:
+            logs = extra[0] if extra else None
+            started_at = extra[1] if len(extra) > 1 else None
+            claimed_at = extra[2] if len(extra) > 2 else None
+            
+            # Is the job still ours? (Checked under the write lock)
+            cursor = conn.execute(
                 """
-                UPDATE jobs
-                SET state        = 'completed',
-                    updated_at   = ?,
-                    completed_at = ?
+                SELECT attempts, max_retries FROM jobs
                 WHERE id = ?
+                  AND state = 'processing'
+                  AND updated_at = COALESCE(?, updated_at)
                 """,
-                (now, now, job_id)
-            )
-            conn.commit()
-        else:
-            # --- Unhappy Path (Retry/DLQ Logic) ---
-            conn.execute("BEGIN IMMEDIATE")  # Lock for read-modify-write
-            
-            # 1. Get current job state
-            cursor = conn.execute(
-                "SELECT attempts, max_retries FROM jobs WHERE id = ?", (job_id,)
+                (job_id, claimed_at)
             )
             job = cursor.fetchone()
             
             if not job:
-                print(f"Error finalizing: Job {job_id} not found.")
-                conn.rollback()
-                return
+                print(f"Skipping result of job {job_id}: no longer held by this worker.")
+                continue
             
+            if logs:
+                conn.executemany(
+                    """
+                    INSERT OR REPLACE INTO job_logs (job_id, stream, segment, offset, length)
+                    VALUES (?, ?, ?, ?, ?)
+                    """,
+                    [(job_id, *entry) for entry in logs]
+                )
+            if started_at is not None:
+                conn.execute(
+                    "UPDATE jobs SET started_at = ? WHERE id = ? AND started_at IS NULL",
+                    (started_at, job_id)
+                )
+            if success:
+                # --- Happy Path ---
+                conn.execute(
+                    """
+                    UPDATE jobs
+                    SET state        = 'completed',
+                        updated_at   = ?,
+                        completed_at = ?
+                    WHERE id = ?
+                      AND state = 'processing'
+                    """,
+                    (now, now, job_id)
+                )
+                continue
+            
+            # --- Unhappy Path (Retry/DLQ Logic) ---
             new_attempts = job['attempts'] + 1
             
             if new_attempts >= job['max_retries']:
-                # 2. Move to Dead Letter Queue (DLQ)
+                # 1. Move to Dead Letter Queue (DLQ)
                 print(f"Job {job_id} failed. Max retries ({job['max_retries']}) reached. Moving to DLQ.")
                 conn.execute(
                     """
@@ -307,24 +1392,26 @@ def finalize_job(job_id, success):
                         attempts   = ?,
                         updated_at = ?
                     WHERE id = ?
+                      AND state = 'processing'
                     """,
                     (new_attempts, now, job_id)
                 )
             else:
-                # 3. Schedule for Retry with Exponential Backoff
+                # 2. Schedule for Retry with Exponential Backoff
                 
                 # Get backoff base from config (default to 2)
-                base_str = get_config('backoff_base', '2')
-                try:
-                    backoff_base = int(base_str)
-                except ValueError:
-                    print(f"Warning: Invalid backoff_base '{base_str}', using 2.")
-                    backoff_base = 2
+                if backoff_base is None:
+                    base_str = get_config('backoff_base', '2')
+                    try:
+                        backoff_base = int(base_str)
+                    except ValueError:
+                        print(f"Warning: Invalid backoff_base '{base_str}', using 2.")
+                        backoff_base = 2
                 
                 # delay = base ^ attempts
                 delay_seconds = backoff_base ** new_attempts
                 
-                retry_run_at = now + timedelta(seconds=delay_seconds)
+                retry_run_at = now + delay_seconds * 1_000_000
                 
                 print(
                     f"Job {job_id} failed. Attempt {new_attempts}/{job['max_retries']}. Retrying in {delay_seconds}s.")
@@ -337,38 +1424,139 @@ def finalize_job(job_id, success):
                         updated_at = ?,
                         run_at     = ?
                     WHERE id = ?
+                      AND state = 'processing'
                     """,
                     (new_attempts, now, retry_run_at, job_id)
                 )
-            conn.commit()  # Commit the read-modify-write transaction
+                retrying = True
+        conn.commit()  # Commit the whole group at once
+        if retrying:
+            # Idle workers sleep until the next due job they knew of;
+            # wake them to take this retry into account
+            notify.notify_workers()
     
     except sqlite3.Error as e:
-        print(f"Database error finalizing job {job_id}: {e}")
-        if not success:  # Only rollback if we were in the 'else' block's transaction
-            conn.rollback()
-    finally:
-        conn.close()
+        ids = ', '.join(str(result[0]) for result in results)
+        print(f"Database error finalizing job(s) {ids}: {e}")
+        conn.rollback()
 
 
-def get_jobs_by_state(state):
-    """Fetches all jobs matching a specific state."""
+@_routed
+def get_job_log(job_id, stream):
+    """
+    Returns (segment, offset, length) of a job's indexed 'out' or 'err'
+    log (segments log backend), or None if it has no entry.
+    """
     conn = get_db_connection()
     try:
-        cursor = conn.execute("SELECT * FROM jobs WHERE state = ?", (state,))
-        jobs = cursor.fetchall()
-        # Convert list of sqlite3.Row to list of dict
-        return [dict(job) for job in jobs]
+        row = conn.execute(
+            "SELECT segment, offset, length FROM job_logs WHERE job_id = ? AND stream = ?",
+            (job_id, stream)
+        ).fetchone()
+        return tuple(row) if row else None
     except sqlite3.Error as e:
-        print(f"Database error getting jobs by state: {e}")
-        return []
-    finally:
-        conn.close()
+        print(f"Database error reading log index for job {job_id}: {e}")
+        return None
 
 
+@_on_every_shard(lambda results: min((r for r in results if r is not None), default=None))
+def get_next_run_at(queues=None):
+    """
+    Returns the earliest run_at (epoch microseconds) among 'failed' and
+    'scheduled' jobs: the next time a job becomes due without a new
+    enqueue. None if there is no such job. With `queues`, only jobs in
+    those queues count (one idx_jobs_queue_due lookup per queue).
+    """
+    conn = get_db_connection()
+    queue_filter = 'queue = ? AND ' if queues else ''
+    try:
+        run_ats = []
+        for queue in (queues or [None]):
+            for state in ('failed', 'scheduled'):
+                row = conn.execute(
+                    f"""
+                    SELECT run_at
+                    FROM jobs
+                    WHERE {queue_filter}state = ? AND run_at IS NOT NULL
+                    ORDER BY run_at ASC
+                    LIMIT 1
+                    """,
+                    (queue, state) if queues else (state,)
+                ).fetchone()
+                if row and row['run_at']:
+                    run_ats.append(row['run_at'])
+        return min(run_ats) if run_ats else None
+    except sqlite3.Error as e:
+        print(f"Database error getting next run time: {e}")
+        return None
+
+
+# Listing cursors are shard * _SHARD_CURSOR_SPAN + rowid
+_SHARD_CURSOR_SPAN = 1 << 40
+
+
+def iter_jobs_by_state(state, after=None, limit=None, archived=False, page_size=500):
+    """
+    Streams jobs matching a state as (cursor, job_dict) pairs, oldest first.
+
+    Uses keyset pagination on rowid (idx_jobs_state), one short query per
+    page, so memory stays constant and the first rows arrive immediately
+    however many jobs match. Pass a returned cursor as `after` to resume
+    just past that job. `limit` caps the total number of jobs yielded.
+    Raises ValueError (before yielding anything) if `after` is not a
+    cursor of this database.
+    """
+    # Cursors encode (shard, rowid); unsharded they are plain rowids
+    first_shard, cursor_value = divmod(after, _SHARD_CURSOR_SPAN) if after is not None else (0, -1)
+    if after is not None and not (after >= 0 and first_shard < shard_count()):
+        raise ValueError(f"Invalid cursor {after}.")
+    return _iter_jobs_by_state(state, first_shard, cursor_value, limit, archived, page_size)
+
+
+def _iter_jobs_by_state(state, first_shard, cursor_value, limit, archived, page_size):
+    """The generator behind iter_jobs_by_state(), from a decoded cursor."""
+    table = 'jobs_archive' if archived else 'jobs'
+    remaining = limit
+    
+    for shard in range(first_shard, shard_count()):
+        with use_shard(shard):
+            conn = get_db_connection()
+        if shard != first_shard:
+            cursor_value = -1
+        
+        while remaining is None or remaining > 0:
+            batch = page_size if remaining is None else min(page_size, remaining)
+            try:
+                rows = conn.execute(
+                    f"""
+                    SELECT rowid AS cursor, *
+                    FROM {table}
+                    WHERE state = ? AND rowid > ?
+                    ORDER BY rowid
+                    LIMIT ?
+                    """,
+                    (state, cursor_value, batch)
+                ).fetchall()
+            except sqlite3.Error as e:
+                print(f"Database error listing jobs: {e}")
+                return
+            
+            for row in rows:
+                job = dict(row)
+                cursor_value = job.pop('cursor')
+                yield shard * _SHARD_CURSOR_SPAN + cursor_value, job
+            
+            if remaining is not None:
+                remaining -= len(rows)
+            if len(rows) < batch:
+                break
+
+
+@_routed
 def retry_dlq_job(job_id):
     """Moves a 'dead' job back to 'pending' to be retried."""
     conn = get_db_connection()
-    now = datetime.now(timezone.utc)
+    now = now_us()
     try:
         # Reset attempts, state, and run_at
         cursor = conn.execute(
@@ -386,6 +1574,7 @@ def retry_dlq_job(job_id):
         
         if cursor.rowcount > 0:
             conn.commit()
+            notify.notify_workers()
             print(f"Job {job_id} has been re-queued from the DLQ.")
         else:
             conn.rollback()
@@ -393,38 +1582,48 @@ def retry_dlq_job(job_id):
     
     except sqlite3.Error as e:
         print(f"Database error retrying job {job_id}: {e}")
-    finally:
-        conn.close()
+        conn.rollback()
 
 
+@_routed
 def release_job(job_id):
     """Resets a 'processing' job back to 'pending' on graceful shutdown."""
     conn = get_db_connection()
-    now = datetime.now(timezone.utc)
+    now = now_us()
     try:
         conn.execute(
             """
             UPDATE jobs
             SET state      = 'pending',
-                updated_at = ?
+                updated_at = ?,
+                started_at = NULL
             WHERE id = ?
               AND state = 'processing'
             """,
             (now, job_id)
         )
         conn.commit()
+        notify.notify_workers()
     except sqlite3.Error as e:
         print(f"Database error releasing job {job_id}: {e}")
-    finally:
-        conn.close()
+        conn.rollback()
 
 
+def _sum_counts(summaries):
+    totals = {}
+    for summary in summaries:
+        for state, count in summary.items():
+            totals[state] = totals.get(state, 0) + count
+    return dict(sorted(totals.items()))
+
+
+@_on_every_shard(_sum_counts)
 def get_job_status_summary():
-    """Gets a count of jobs grouped by state."""
+    """Gets a count of jobs grouped by state (from the job_counts table)."""
     conn = get_db_connection()
     try:
         cursor = conn.execute(
-            "SELECT state, COUNT(*) as count FROM jobs GROUP BY state"
+            "SELECT state, count FROM job_counts WHERE count > 0 ORDER BY state"
         )
         rows = cursor.fetchall()
         # Return as a simple dict: {'pending': 5, 'completed': 10}
@@ -432,55 +1631,50 @@ def get_job_status_summary():
     except sqlite3.Error as e:
         print(f"Database error getting job summary: {e}")
         return {}
-    finally:
-        conn.close()
 
 
-def mark_job_started(job_id):
-    """Sets the started_at timestamp for a job."""
+@_on_every_shard(lambda results: None)
+def recount_jobs():
+    """Rebuilds job_counts from a full scan of the jobs table."""
     conn = get_db_connection()
-    now = datetime.now(timezone.utc)
     try:
-        conn.execute(
-            "UPDATE jobs SET started_at = ? WHERE id = ?", (now, job_id)
-        )
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM job_counts")
+        conn.execute(_RECOUNT_SQL)
         conn.commit()
     except sqlite3.Error as e:
-        print(f"Database error marking job started: {e}")
-    finally:
-        conn.close()
+        print(f"Database error recounting jobs: {e}")
+        conn.rollback()
 
 
 def get_all_config():
-    """Gets all key-value pairs from the config table."""
-    conn = get_db_connection()
+    """Gets all key-value pairs from the (cached) config table."""
     try:
-        cursor = conn.execute("SELECT key, value FROM config")
-        return {row['key']: row['value'] for row in cursor.fetchall()}
+        return dict(_cached_config())
     except sqlite3.Error as e:
         print(f"Database error getting all config: {e}")
         return {}
-    finally:
-        conn.close()
 
 
+@_routed
 def delete_job(job_id):
     """Permanently deletes a job from the queue."""
     conn = get_db_connection()
     try:
         conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        conn.execute("DELETE FROM job_logs WHERE job_id = ?", (job_id,))
         conn.commit()
         print(f"DB: Deleted job {job_id}")
     except sqlite3.Error as e:
         print(f"Database error deleting job {job_id}: {e}")
-    finally:
-        conn.close()
+        conn.rollback()
 
 
+@_routed
 def requeue_job(job_id):
     """Moves any 'failed' or 'dead' job back to 'pending'."""
     conn = get_db_connection()
-    now = datetime.now(timezone.utc)
+    now = now_us()
     try:
         # This is a more general-purpose "retry"
         cursor = conn.execute(
@@ -497,6 +1691,7 @@ def requeue_job(job_id):
         )
         if cursor.rowcount > 0:
             conn.commit()
+            notify.notify_workers()
             print(f"DB: Re-queued job {job_id}")
         else:
             conn.rollback()
@@ -504,5 +1699,126 @@ def requeue_job(job_id):
     
     except sqlite3.Error as e:
         print(f"Database error re-queuing job {job_id}: {e}")
-    finally:
-        conn.close()
+        conn.rollback()
+
+
+_DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+def parse_duration(text):
+    """
+    Parses a duration such as '90s', '30m', '12h', '7d' or '2w' (a bare
+    number means seconds) into seconds. Raises ValueError if invalid.
+    """
+    text = str(text).strip().lower()
+    unit = text[-1:] if text[-1:] in _DURATION_UNITS else 's'
+    number = text[:-1] if text[-1:] in _DURATION_UNITS else text
+    try:
+        value = float(number)
+    except ValueError:
+        raise ValueError(f"Invalid duration '{text}'. Use e.g. 90s, 30m, 12h, 7d or 2w.")
+    if not math.isfinite(value * _DURATION_UNITS[unit]):
+        raise ValueError(f"Invalid duration '{text}'. Must be a finite number.")
+    if value < 0:
+        raise ValueError(f"Invalid duration '{text}'. Must not be negative.")
+    return value * _DURATION_UNITS[unit]
+
+
+_ARCHIVE_COLUMNS = ('id, command, state, attempts, max_retries, priority, timeout, run_at, '
+                    'created_at, updated_at, started_at, completed_at, lease_expires_at, queue, '
+                    'callable, args')
+
+
+@_on_every_shard(sum)
+def archive_jobs(older_than_seconds, chunk_size=1000):
+    """
+    Moves 'completed' and 'dead' jobs last updated more than
+    `older_than_seconds` ago from jobs into jobs_archive.
+
+    Works in chunks of `chunk_size` rows, one short transaction each, so
+    workers are never locked out for long. Returns the number of jobs moved.
+    """
+    conn = get_db_connection()
+    now = now_us()
+    # Longer ago than the epoch matches nothing (and would overflow SQLite's integers)
+    cutoff = int(max(now - older_than_seconds * 1_000_000, 0))
+    params = {'cutoff': cutoff, 'limit': chunk_size, 'now': now}
+    # Same rows for both statements: the write lock is held in between
+    chunk_sql = """
+        SELECT rowid
+        FROM jobs
+        WHERE state IN ('completed', 'dead')
+          AND updated_at < :cutoff
+        ORDER BY state, updated_at
+        LIMIT :limit
+    """
+    archived = 0
+    try:
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                f"""
+                INSERT OR REPLACE INTO jobs_archive ({_ARCHIVE_COLUMNS}, archived_at)
+                SELECT {_ARCHIVE_COLUMNS}, :now
+                FROM jobs
+                WHERE rowid IN ({chunk_sql})
+                """,
+                params
+            )
+            moved = conn.execute(f"DELETE FROM jobs WHERE rowid IN ({chunk_sql})", params).rowcount
+            conn.commit()
+            archived += moved
+            if moved < chunk_size:
+                return archived
+    except sqlite3.Error as e:
+        print(f"Database error archiving jobs: {e}")
+        conn.rollback()
+        return archived
+
+
+def run_retention():
+    """
+    Applies the 'archive_after' retention policy (e.g. '7d'), if one is
+    configured. Returns the number of jobs archived.
+    """
+    archive_after = get_config('archive_after')
+    if not archive_after:
+        return 0
+    try:
+        older_than = parse_duration(archive_after)
+    except ValueError as e:
+        print(f"Warning: Ignoring archive_after: {e}")
+        return 0
+    count = archive_jobs(older_than)
+    if count:
+        print(f"Retention: Archived {count} job(s) older than {archive_after}.")
+    return count
+
+
+def get_recent_archived_jobs(limit=25):
+    """Fetches the most recently archived jobs."""
+    return _recent_jobs("SELECT * FROM jobs_archive ORDER BY archived_at DESC LIMIT ?",
+                        (limit,), limit, 'archived_at')
+
+
+def get_recent_jobs(states, order_by, limit=25):
+    """
+    Fetches the `limit` jobs in `states` with the latest `order_by`
+    timestamp (updated_at or completed_at), newest first.
+    """
+    placeholders = ', '.join('?' * len(states))
+    sql = f"SELECT * FROM jobs WHERE state IN ({placeholders}) ORDER BY {order_by} DESC LIMIT ?"
+    return _recent_jobs(sql, (*states, limit), limit, order_by)
+
+
+def _recent_jobs(sql, params, limit, order_by):
+    """Runs a newest-first LIMIT query on every shard and merges the results."""
+    jobs = []
+    for index in range(shard_count()):
+        with use_shard(index):
+            conn = get_db_connection()
+        try:
+            jobs.extend(dict(job) for job in conn.execute(sql, params).fetchall())
+        except sqlite3.Error as e:
+            print(f"Database error getting recent jobs: {e}")
+    return heapq.nlargest(limit, jobs, key=lambda job: job[order_by] or 0)
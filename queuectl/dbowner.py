@@ -0,0 +1,169 @@
+# queuectl/dbowner.py
+"""
+Optional single-writer process for `worker start --db-owner`.
+
+Normally every worker writes to SQLite itself, so with many workers they
+all queue on the database write lock (and, past the busy timeout, fail
+with "database is locked"). In db-owner mode one process owns all worker
+writes: workers send claims, finalizations, lease renewals and releases
+over a shared multiprocessing queue and wait for the answer on their own
+pipe. The owner drains whatever requests have piled up and answers them
+in batches: all claims for the same queues share one claim transaction,
+all results one finalize transaction, all heartbeats one lease update.
+
+Reads (config, next due time) stay local to each worker, since WAL
+readers never block the writer.
+"""
+
+import os
+import queue
+import signal
+
+from . import database
+
+MAX_BATCH = 256  # Requests answered per round
+
+# Operations a worker may send
+_OPS = ('claim', 'finalize', 'extend', 'release', 'reap')
+
+
+class DBOwnerClient:
+    """
+    A worker's handle on the db-owner process. It offers the subset of
+    the database module's API that run_worker_loop writes through.
+    """
+    
+    def __init__(self, requests, reply_conn, index):
+        self.requests = requests
+        self.reply_conn = reply_conn
+        self.index = index
+    
+    def _call(self, op, arg=None):
+        self.requests.put((self.index, op, arg))
+        return self.reply_conn.recv()
+    
+    def fetch_and_lock_jobs(self, limit, queues=None, start_now=None):
+        return self._call('claim', (limit, queues, start_now))
+    
+    def finalize_job(self, job_id, success, logs=None, started_at=None, claimed_at=None):
+        self._call('finalize', [(job_id, success, logs, started_at, claimed_at)])
+    
+    def finalize_jobs(self, results):
+        if results:
+            self._call('finalize', list(results))
+    
+    def extend_leases(self, job_ids):
+        if job_ids:
+            self._call('extend', list(job_ids))
+    
+    def release_job(self, job_id):
+        self._call('release', job_id)
+    
+    def reap_expired_leases(self):
+        return self._call('reap')
+    
+    def get_lease_timeout(self):
+        return database.get_lease_timeout()
+
+
+def _answer(batch):
+    """
+    Executes one batch of requests, merging writes of the same kind.
+    Returns (worker_index, reply) pairs.
+    """
+    by_op = {op: [] for op in _OPS}
+    for index, op, arg in batch:
+        by_op[op].append((index, arg))
+    answers = []
+    
+    results = [result for _, arg in by_op['finalize'] for result in arg]
+    if results:
+        database.finalize_jobs(results)
+    answers.extend((index, None) for index, _ in by_op['finalize'])
+    
+    job_ids = [job_id for _, arg in by_op['extend'] for job_id in arg]
+    if job_ids:
+        database.extend_leases(job_ids)
+    answers.extend((index, None) for index, _ in by_op['extend'])
+    
+    for index, job_id in by_op['release']:
+        database.release_job(job_id)
+        answers.append((index, None))
+    
+    if by_op['reap']:
+        count = database.reap_expired_leases()
+        answers.extend((index, count) for index, _ in by_op['reap'])
+    
+    # One claim per distinct queue list; best jobs go to the earliest
+    # requests. Each request first gets the jobs it starts right away
+    # (stamped started_at, taken from the top), then its prefetched ones.
+    claims = {}
+    for index, (limit, queues, start_now) in by_op['claim']:
+        start_now = limit if start_now is None else min(start_now, limit)
+        claims.setdefault(tuple(queues) if queues else None, []).append((index, limit, start_now))
+    for queues, requests in claims.items():
+        starting = sum(start_now for _, _, start_now in requests)
+        jobs = database.fetch_and_lock_jobs(sum(limit for _, limit, _ in requests), queues, starting)
+        started, buffered = jobs[:starting], jobs[starting:]
+        for index, limit, start_now in requests:
+            mine, started = started[:start_now], started[start_now:]
+            take = limit - len(mine)
+            mine, buffered = mine + buffered[:take], buffered[take:]
+            answers.append((index, mine))
+    return answers
+
+
+def run_db_owner(requests, replies):
+    """
+    Serves worker requests until a None sentinel arrives (sent by the
+    parent once every worker has exited) or the parent disappears.
+    `replies` holds each worker's sending end of its reply pipe.
+    """
+    # Ctrl+C reaches the whole process group; keep serving until the
+    # workers have drained, the parent stops us afterwards.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    parent = os.getppid()
+    print(f"DB owner {os.getpid()}: Serving writes for {len(replies)} worker(s).")
+    
+    batches = 0
+    handled = 0
+    while True:
+        try:
+            first = requests.get(timeout=1.0)
+        except queue.Empty:
+            if os.getppid() != parent:
+                break  # Orphaned: the parent died without stopping us
+            continue
+        if first is None:
+            break
+        
+        batch = [first]
+        stopping = False
+        while len(batch) < MAX_BATCH:
+            try:
+                item = requests.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                stopping = True
+                break
+            batch.append(item)
+        
+        try:
+            answers = _answer(batch)
+        except Exception as e:
+            # Never leave a worker waiting on its pipe forever
+            print(f"DB owner {os.getpid()}: Error answering batch: {e}")
+            answers = [(index, [] if op == 'claim' else None) for index, op, _ in batch]
+        for index, value in answers:
+            try:
+                replies[index].send(value)
+            except OSError:
+                pass  # That worker is gone
+        batches += 1
+        handled += len(batch)
+        if stopping:
+            break
+    
+    print(f"DB owner {os.getpid()}: Exiting after {handled} request(s) in {batches} batch(es).")
@@ -0,0 +1,143 @@
+# queuectl/logstore.py
+"""
+Where job output is written and read back.
+
+Two backends, chosen with the 'log_backend' config key (read by each
+worker when it starts):
+
+- files (default): every job writes logs/<id>.out.log and
+  logs/<id>.err.log, as always.
+- segments: a running job writes to two spool files in logs/spool/.
+  When it finishes, the worker appends both to its current segment file
+  in logs/segments/ (rotated past 'log_segment_mb', default 64 MiB),
+  deletes the spool files, and the job's (segment, offset, length)
+  entries are indexed in the job_logs table in the same transaction
+  that finalizes the job. A million jobs leave a few dozen segment files
+  instead of two million small ones, and old output is removed by
+  deleting whole segments.
+
+read_job_log() serves `queuectl logs` and the dashboard from either
+backend, so switching backends needs no migration.
+"""
+
+import os
+import shutil
+import time
+
+from . import database
+from .config import LOG_DIR
+
+BACKENDS = ('files', 'segments')
+DEFAULT_BACKEND = 'files'
+
+SEGMENT_DIR = os.path.join(LOG_DIR, 'segments')
+SPOOL_DIR = os.path.join(LOG_DIR, 'spool')
+DEFAULT_SEGMENT_MB = 64
+
+STREAMS = ('out', 'err')
+
+
+def get_backend():
+    """The configured log backend (config key 'log_backend')."""
+    backend = database.get_config('log_backend', DEFAULT_BACKEND)
+    if backend not in BACKENDS:
+        print(f"Warning: Invalid log_backend '{backend}', using '{DEFAULT_BACKEND}'.")
+        return DEFAULT_BACKEND
+    return backend
+
+
+def job_log_paths(job_id, backend=DEFAULT_BACKEND):
+    """(stdout_path, stderr_path) a running job writes to under `backend`."""
+    if backend == 'segments':
+        return tuple(os.path.join(SPOOL_DIR, f"{job_id}.{stream}") for stream in STREAMS)
+    return tuple(os.path.join(LOG_DIR, f"{job_id}.{stream}.log") for stream in STREAMS)
+
+
+class SegmentWriter:
+    """
+    Appends finished jobs' spooled output to this process's segment files.
+    Each writer owns its segments (named after its start time and pid),
+    so workers never interleave writes.
+    """
+    
+    def __init__(self, segment_mb=None):
+        if segment_mb is None:
+            value = database.get_config('log_segment_mb', DEFAULT_SEGMENT_MB)
+            try:
+                segment_mb = max(int(value), 1)
+            except ValueError:
+                print(f"Warning: Invalid log_segment_mb '{value}', using {DEFAULT_SEGMENT_MB}.")
+                segment_mb = DEFAULT_SEGMENT_MB
+        self.max_size = segment_mb * 1024 * 1024
+        self.segment = None
+        self.file = None
+    
+    def _rotate(self):
+        self.close()
+        os.makedirs(SEGMENT_DIR, exist_ok=True)
+        self.segment = f"{time.time_ns() // 1000}-{os.getpid()}.seg"
+        self.file = open(os.path.join(SEGMENT_DIR, self.segment), 'ab')
+    
+    def store(self, job_id):
+        """
+        Moves a finished job's spool files into the current segment.
+        Returns its index entries [(stream, segment, offset, length), ...],
+        or None if they could not be stored (the spool files are kept).
+        """
+        entries = []
+        spool_paths = job_log_paths(job_id, 'segments')
+        try:
+            if self.file is None or self.file.tell() >= self.max_size:
+                self._rotate()
+            for stream, path in zip(STREAMS, spool_paths):
+                offset = self.file.tell()
+                try:
+                    with open(path, 'rb') as spool:
+                        shutil.copyfileobj(spool, self.file, 1024 * 1024)
+                except FileNotFoundError:
+                    pass  # The job never got to start; index it as empty
+                entries.append((stream, self.segment, offset, self.file.tell() - offset))
+            # Readers look the range up once finalize commits the index
+            self.file.flush()
+        except OSError as e:
+            print(f"Worker {os.getpid()}: Could not store logs of job {job_id}: {e}")
+            return None
+        
+        for path in spool_paths:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        return entries
+    
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def read_job_log(job_id, stream):
+    """
+    Returns a job's 'out' or 'err' log as text, or None if there is none.
+    Looks for a job still running under the segments backend (its spool
+    file) first, then the segment index, then a logs/<id>.<stream>.log file.
+    """
+    spool_path = job_log_paths(job_id, 'segments')[STREAMS.index(stream)]
+    file_path = job_log_paths(job_id, 'files')[STREAMS.index(stream)]
+    
+    if not os.path.exists(spool_path):
+        entry = database.get_job_log(job_id, stream)
+        if entry is not None:
+            segment, offset, length = entry
+            try:
+                with open(os.path.join(SEGMENT_DIR, segment), 'rb') as f:
+                    f.seek(offset)
+                    return f.read(length).decode(errors='replace')
+            except FileNotFoundError:
+                pass  # Segment deleted to reclaim space
+    
+    for path in (spool_path, file_path):
+        if os.path.exists(path):
+            with open(path, 'r', errors='replace') as f:
+                return f.read()
+    return None
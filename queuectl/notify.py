@@ -0,0 +1,109 @@
+# queuectl/notify.py
+"""
+Local wakeup channel between job producers and idle workers.
+
+Each worker binds a Unix datagram socket in NOTIFY_DIR while it runs.
+Anything that makes work available (enqueue, requeue, release) calls
+notify_workers(), which sends a one-byte datagram to every socket so
+idle workers wake immediately instead of polling the database.
+
+Platforms without AF_UNIX datagram sockets get no listener, and
+workers fall back to polling.
+"""
+
+import os
+import select
+import socket
+
+from .config import NOTIFY_DIR
+
+_SUPPORTED = hasattr(socket, 'AF_UNIX') and os.name != 'nt'
+
+
+class WakeupListener:
+    """A worker's end of the wakeup channel."""
+    
+    def __init__(self):
+        os.makedirs(NOTIFY_DIR, exist_ok=True)
+        self.path = os.path.join(NOTIFY_DIR, f"{os.getpid()}.sock")
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # Left behind by a dead process with our pid
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        self.sock.setblocking(False)
+    
+    def fileno(self):
+        return self.sock.fileno()
+    
+    def wait(self, timeout):
+        """Blocks until woken or `timeout` seconds pass. Returns True if woken."""
+        readable, _, _ = select.select([self.sock], [], [], timeout)
+        if readable:
+            self.drain()
+        return bool(readable)
+    
+    def drain(self):
+        """Discards queued wakeups (many pings collapse into one wakeup)."""
+        try:
+            while True:
+                self.sock.recv(64)
+        except (BlockingIOError, InterruptedError):
+            pass
+    
+    def wake(self):
+        """Wakes this listener (safe to call from a signal handler)."""
+        _send(self.path)
+    
+    def close(self):
+        self.sock.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def create_listener():
+    """Returns a WakeupListener, or None where the channel is unsupported."""
+    if not _SUPPORTED:
+        return None
+    try:
+        return WakeupListener()
+    except OSError as e:
+        print(f"Worker {os.getpid()}: Wakeup channel unavailable ({e}); polling instead.")
+        return None
+
+
+def _send(path):
+    """Sends one wakeup datagram to `path`. Returns False if nobody listens there."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        sock.setblocking(False)
+        sock.sendto(b'!', path)
+    except BlockingIOError:
+        pass  # Receiver's buffer is full: it already has a wakeup pending
+    except ConnectionRefusedError:
+        return False  # Socket file exists but nobody is bound to it
+    except OSError:
+        pass  # Gone already, or not ours to clean up
+    finally:
+        sock.close()
+    return True
+
+
+def notify_workers():
+    """Wakes every idle worker listening on this queue. Never raises."""
+    if not _SUPPORTED:
+        return
+    try:
+        names = os.listdir(NOTIFY_DIR)
+    except OSError:
+        return  # No worker has ever listened here
+    for name in names:
+        if not name.endswith('.sock'):
+            continue
+        path = os.path.join(NOTIFY_DIR, name)
+        if not _send(path):
+            try:
+                os.unlink(path)  # Stale socket from a killed worker
+            except OSError:
+                pass
@@ -0,0 +1,65 @@
+# queuectl/output.py
+"""
+Machine-readable output for the listing commands.
+
+Rows (dicts) are streamed straight from a database iterator into one
+buffered writer on stdout, so exports of millions of jobs run at I/O
+speed instead of paying a flush per click.echo() call. Values are
+written as stored: timestamps stay integer epoch microseconds.
+"""
+
+import csv
+import io
+import json
+import os
+import sys
+
+FORMATS = ('table', 'jsonl', 'csv')
+
+_BUFFER_SIZE = 1 << 16
+
+
+def _open_stdout():
+    """A large-buffered text writer on stdout's file descriptor."""
+    sys.stdout.flush()
+    raw = open(sys.stdout.fileno(), 'wb', buffering=_BUFFER_SIZE, closefd=False)
+    return io.TextIOWrapper(raw, encoding='utf-8', newline='')
+
+
+def write_rows(rows, fmt):
+    """
+    Writes an iterable of dicts to stdout as 'jsonl' or 'csv'.
+
+    CSV columns are taken from the first row; nothing is written when
+    there are no rows. Returns the number of rows written.
+    """
+    out = _open_stdout()
+    count = 0
+    try:
+        if fmt == 'jsonl':
+            dumps = json.dumps
+            for row in rows:
+                out.write(dumps(row))
+                out.write('\n')
+                count += 1
+        elif fmt == 'csv':
+            writer = None
+            for row in rows:
+                if writer is None:
+                    writer = csv.DictWriter(out, fieldnames=list(row), lineterminator='\n')
+                    writer.writeheader()
+                writer.writerow(row)
+                count += 1
+        else:
+            raise ValueError(f"Unsupported output format: {fmt}")
+        out.flush()
+    except BrokenPipeError:
+        # Downstream (e.g. `head`) closed the pipe: point stdout at
+        # /dev/null so the remaining flushes succeed, and stop quietly.
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        os.close(devnull)
+        out.flush()
+    finally:
+        out.detach()
+    return count
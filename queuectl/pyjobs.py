@@ -0,0 +1,192 @@
+# queuectl/pyjobs.py
+"""
+In-process execution of Python callable jobs.
+
+A job enqueued as {"callable": "pkg.module:func", "args": [...]} is not
+started as a shell command. The worker hands it to one of its warm
+runner processes, which calls func(*args) with stdout and stderr
+redirected into the job's usual log files and reports an exit code back
+over a pipe: 0 if the call returned, 1 if it raised (the traceback goes
+to the stderr log), or the code of a SystemExit.
+
+Runners live as long as their worker and are reused job after job, so
+the interpreter starts once per runner rather than once per job, and a
+module imported by one job (kept in sys.modules, its functions cached by
+spec) is already loaded for the next. Code changes therefore need a
+worker restart. The worker's working directory is on sys.path.
+
+A job past its timeout is stopped by terminating its runner, which is
+then replaced on demand.
+"""
+
+import importlib
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import traceback
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def _resolve(spec):
+    """Imports 'pkg.module:func' (or 'pkg.module:Class.method') once."""
+    module_name, _, attribute = spec.partition(':')
+    target = importlib.import_module(module_name)
+    for name in attribute.split('.'):
+        target = getattr(target, name)
+    return target
+
+
+def _call(spec, args):
+    """Runs one job with fds 1/2 already redirected; returns its exit code."""
+    try:
+        _resolve(spec)(*args)
+        return 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    except BaseException:
+        traceback.print_exc()
+        return 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+
+def _runner_main(conn):
+    """Runner process: executes (spec, args, out_path, err_path) requests until told to stop."""
+    # Ctrl+C reaches the whole process group; like other running jobs,
+    # ours finish and the worker stops us afterwards. SIGTERM (timeouts)
+    # must kill us, not run the worker's handler inherited over fork.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # Job output must reach fds 1/2, whatever the parent had swapped in
+    sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+    if os.getcwd() not in sys.path:
+        sys.path.insert(0, os.getcwd())
+    saved_stdout, saved_stderr = os.dup(1), os.dup(2)
+    
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            break  # The worker is gone
+        if request is None:
+            break
+        
+        spec, args, out_path, err_path = request
+        sys.stdout.flush()
+        sys.stderr.flush()
+        with open(out_path, 'w') as f_out, open(err_path, 'w') as f_err:
+            # At the fd level, so C extensions and child processes are captured too
+            os.dup2(f_out.fileno(), 1)
+            os.dup2(f_err.fileno(), 2)
+            try:
+                code = _call(spec, args)
+            finally:
+                os.dup2(saved_stdout, 1)
+                os.dup2(saved_stderr, 2)
+        try:
+            conn.send(code)
+        except OSError:
+            break
+
+
+class _Runner:
+    """One warm interpreter and the worker's end of its pipe."""
+    
+    def __init__(self):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_runner_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+    
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass  # Already dead
+        self.process.join(timeout=1.0)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class CallableRun:
+    """
+    A callable job running on a runner. It offers the part of the Popen
+    API the worker uses (pid, wait, terminate, kill) and is selectable
+    (readable once the job has finished), so it doubles as its own
+    exit watch; close() hands the runner back to the pool.
+    """
+    
+    def __init__(self, pool, runner):
+        self._pool = pool
+        self._runner = runner
+        self._signalled = False
+        self.pid = runner.process.pid
+        self.returncode = None
+    
+    def fileno(self):
+        return self._runner.conn.fileno()
+    
+    def wait(self):
+        if self.returncode is None:
+            try:
+                self.returncode = self._runner.conn.recv()
+            except (EOFError, OSError):
+                # The runner died (timeout kill, crash): report how
+                self._runner.process.join()
+                self.returncode = self._runner.process.exitcode
+                self._signalled = True
+        return self.returncode
+    
+    def terminate(self):
+        self._signalled = True
+        self._runner.process.terminate()
+    
+    def kill(self):
+        self._signalled = True
+        self._runner.process.kill()
+    
+    def close(self):
+        # A runner we signalled may die at any moment; never reuse it
+        reusable = self.returncode is not None and not self._signalled
+        self._pool.release(self._runner, reusable)
+
+
+class RunnerPool:
+    """A worker's warm runners, started lazily and reused."""
+    
+    def __init__(self):
+        self._idle = []
+    
+    def start(self, job, out_path, err_path):
+        """Starts a callable job on an idle (or new) runner; returns its CallableRun."""
+        request = (job['callable'], json.loads(job.get('args') or '[]'), out_path, err_path)
+        while self._idle:
+            runner = self._idle.pop()
+            try:
+                runner.conn.send(request)
+                return CallableRun(self, runner)
+            except OSError:
+                runner.stop()  # Died while idle; try the next one
+        runner = _Runner()
+        runner.conn.send(request)
+        return CallableRun(self, runner)
+    
+    def release(self, runner, reusable):
+        if reusable:
+            self._idle.append(runner)
+        else:
+            runner.stop()
+    
+    def close(self):
+        for runner in self._idle:
+            runner.stop()
+        self._idle = []
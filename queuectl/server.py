@@ -0,0 +1,283 @@
+# queuectl/server.py
+"""
+Long-running submission endpoint for `queuectl serve`.
+
+Producers connect over a Unix stream socket (or, optionally, localhost
+TCP) and write jobs as NDJSON: one job object per line, in the same
+format `queuectl enqueue` accepts. Every line gets exactly one reply
+line, in order:
+
+    {"ok": true, "id": "job1"}
+    {"ok": false, "id": "job2", "error": "Job with ID 'job2' already exists."}
+
+Connection threads parse and validate. A single committer thread collects
+submissions from all clients for a few milliseconds and inserts them in
+one transaction (group commit), so thousands of concurrent single-job
+submissions cost a handful of fsyncs instead of one each. A reply is
+sent only after its transaction has committed, by a writer thread of
+its connection, so a client that does not read its replies stalls only
+itself.
+"""
+
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+
+from . import database
+from .config import SERVE_SOCKET
+
+BATCH_WINDOW = 0.005  # Seconds to wait for more submissions before committing
+MAX_BATCH = 1000      # Submissions per transaction
+MAX_PENDING = 10000   # Unanswered submissions per connection before it stops being read
+
+UNIX_SUPPORTED = hasattr(socket, 'AF_UNIX') and os.name != 'nt'
+
+
+class _Client:
+    """One connection's reply side, fed by the committer thread."""
+    
+    def __init__(self, sock):
+        self.sock = sock
+        self.pending = 0
+        self.broken = False
+        self.idle = threading.Condition()
+        self.outbox = queue.Queue()
+        self.writer = threading.Thread(target=self._write, daemon=True)
+        self.writer.start()
+    
+    def submitted(self):
+        """Counts a submission; blocks while too many await their replies."""
+        with self.idle:
+            while self.pending >= MAX_PENDING:
+                self.idle.wait()
+            self.pending += 1
+    
+    def reply(self, payload, count):
+        """Queues reply lines for `count` submissions, in order; never blocks."""
+        self.outbox.put((payload, count))
+    
+    def _write(self):
+        while True:
+            item = self.outbox.get()
+            if item is None:
+                return
+            payload, count = item
+            if not self.broken:
+                try:
+                    self.sock.sendall(payload)
+                except OSError:
+                    self.broken = True  # Client went away; drop its replies
+            self.answered(count)
+    
+    def answered(self, count):
+        with self.idle:
+            self.pending -= count
+            self.idle.notify_all()
+    
+    def wait_answered(self):
+        """Waits until every reply has been written, then stops the writer."""
+        with self.idle:
+            while self.pending:
+                self.idle.wait()
+        self.outbox.put(None)
+        self.writer.join()
+
+
+class _Committer(threading.Thread):
+    """Drains submissions into group-committed transactions."""
+    
+    def __init__(self, batch_window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        super().__init__(name='queuectl-committer', daemon=True)
+        self.submissions = queue.Queue()
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.committed = 0
+        self.batches = 0
+    
+    def submit(self, client, job, error=None):
+        client.submitted()
+        self.submissions.put((client, job, error))
+    
+    def stop(self):
+        self.submissions.put(None)
+        self.join()
+    
+    def _next_batch(self):
+        """Blocks for one submission, then gathers more for up to batch_window."""
+        first = self.submissions.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self.submissions.get(timeout=remaining) if remaining > 0 else self.submissions.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self.submissions.put(None)  # Finish this batch, then stop
+                break
+            batch.append(item)
+        return batch
+    
+    def run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                database.close_db_connection()
+                return
+            self._commit(batch)
+    
+    def _commit(self, batch):
+        valid = [(index, job) for index, (_, job, error) in enumerate(batch) if error is None]
+        failures = {}
+        if valid:
+            inserted, errors = database.create_jobs_bulk(valid, chunk_size=self.max_batch)
+            self.committed += inserted
+            failures = {index: message for index, _, message in errors}
+            if inserted + len(failures) != len(valid):
+                # Which rows committed is unknown: acknowledge none of them
+                print(f"Server: batch of {len(valid)} inserted {inserted} with "
+                      f"{len(failures)} error(s); not acknowledging it.")
+                failures = {index: "Commit outcome unknown; check before resubmitting."
+                            for index, _ in valid if index not in failures}
+        self.batches += 1
+        
+        # Group reply lines per client so each gets one sendall per batch
+        replies = {}
+        for index, (client, job, error) in enumerate(batch):
+            error = error or failures.get(index)
+            job_id = job.get('id') if isinstance(job, dict) else None
+            reply = {'ok': error is None, 'id': job_id}
+            if error:
+                reply['error'] = error
+            replies.setdefault(client, []).append(json.dumps(reply))
+        
+        for client, lines in replies.items():
+            client.reply(('\n'.join(lines) + '\n').encode(), len(lines))
+
+
+class _SubmissionHandler(socketserver.StreamRequestHandler):
+    """Reads NDJSON job lines from one connection."""
+    
+    def handle(self):
+        client = _Client(self.connection)
+        committer = self.server.committer
+        for line in self.rfile:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                job = json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                committer.submit(client, None, f"Invalid JSON: {e}")
+                continue
+            # Rejected here, a bad job never reaches a shared batch
+            try:
+                database.validate_job(job)
+            except ValueError as e:
+                committer.submit(client, job, str(e))
+                continue
+            committer.submit(client, job)
+        # Keep the connection open until every reply has been written
+        client.wait_answered()
+
+
+if UNIX_SUPPORTED:
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(socket_path=SERVE_SOCKET, port=None, batch_window=BATCH_WINDOW,
+          max_batch=MAX_BATCH, stop_event=None):
+    """
+    Accepts submissions on `socket_path` (and on 127.0.0.1:`port` if given)
+    until `stop_event` is set. Pass socket_path=None to skip the Unix socket.
+    """
+    committer = _Committer(batch_window, max_batch)
+    committer.start()
+    servers = []
+    
+    def start(server):
+        server.committer = committer
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    
+    try:
+        if socket_path and not UNIX_SUPPORTED:
+            print("Unix sockets are not supported on this platform; use --port.")
+            socket_path = None
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)  # Left behind by a killed server
+            start(_UnixServer(socket_path, _SubmissionHandler))
+            print(f"Listening on unix:{socket_path}")
+        if port is not None:
+            start(_TCPServer(('127.0.0.1', port), _SubmissionHandler))
+            print(f"Listening on tcp:127.0.0.1:{port}")
+        
+        stop_event = stop_event or threading.Event()
+        while not stop_event.wait(1.0):
+            pass
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+        if socket_path and servers:
+            try:
+                os.unlink(socket_path)
+            except FileNotFoundError:
+                pass
+        committer.stop()
+        print(f"Server stopped. Committed {committer.committed} job(s) in {committer.batches} batch(es).")
+
+
+def submit(lines, socket_path=SERVE_SOCKET):
+    """
+    Sends NDJSON job lines to a running `queuectl serve` and yields
+    (line_number, reply_dict) pairs as replies arrive. Blank lines are
+    skipped but still counted.
+
+    Lines are written from a helper thread so a large submission never
+    deadlocks against the server's replies. Raises OSError if the server
+    is unreachable.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(socket_path)
+    sent = queue.Queue()
+    send_error = []
+    
+    def sender():
+        try:
+            with sock.makefile('wb') as out:
+                for line_no, line in enumerate(lines, start=1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    sent.put(line_no)
+                    out.write(line.encode() + b'\n')
+            sock.shutdown(socket.SHUT_WR)
+        except OSError as e:
+            send_error.append(e)
+    
+    thread = threading.Thread(target=sender, daemon=True)
+    thread.start()
+    try:
+        with sock.makefile('rb') as replies:
+            for reply in replies:
+                yield sent.get(), json.loads(reply)
+        thread.join()
+        if send_error:
+            raise send_error[0]
+    finally:
+        sock.close()
@@ -3,44 +3,104 @@
 import subprocess
 import time
 import os
+import selectors
 import signal
+import socket
+import threading
 import multiprocessing
+import random
+import shutil
+from collections import deque
+from functools import lru_cache
 from . import database
-from .config import LOG_DIR
+from . import notify
+from . import logstore
+from . import pyjobs
 
+# Longest an idle worker sleeps without a wakeup. Enqueues, requeues and
+# releases wake workers directly; this only bounds how long a missed
+# wakeup (e.g. a job inserted by another tool) can go unnoticed.
+IDLE_POLL_INTERVAL = 30.0
 
-def execute_job(job):
+
+# Characters that only /bin/sh can interpret (quoting, globs, pipes,
+# redirection, expansion, env assignments...). Commands without any of
+# them are plain "program arg arg" and can be exec'd directly.
+_SHELL_METACHARACTERS = frozenset('|&;<>()$`\\"\'*?[]{}#~=%!\n')
+
+
+@lru_cache(maxsize=256)
+def _which(program):
+    return shutil.which(program)
+
+
+def _direct_argv(command):
+    """The argv to run `command` without a shell, or None if it needs one."""
+    if any(char in _SHELL_METACHARACTERS for char in command):
+        return None
+    argv = command.split()
+    if not argv:
+        return None
+    # Shell builtins (cd, exit...) and missing programs go through the
+    # shell, which also gives them the usual error message and exit code
+    path = _which(argv[0])
+    if path is None:
+        return None
+    return [path] + argv[1:]
+
+
+def execute_job(job, executor='shell', runners=None, log_backend=logstore.DEFAULT_BACKEND):
     """
     Executes the job's command in a NON-BLOCKING subprocess,
-    redirecting stdout/stderr to log files.
+    redirecting stdout/stderr to log files (per-job files, or spool
+    files for the segments backend; see logstore.py).
+
+    A Python callable job runs on one of `runners` (a pyjobs.RunnerPool)
+    instead, writing to the same log files; its Popen stand-in is a
+    pyjobs.CallableRun and no log file handles are returned.
+
+    With executor='spawn', a command without shell metacharacters is
+    exec'd directly instead of through /bin/sh, so a trivial job costs
+    one vfork+exec (CPython's default spawn path on Linux) instead of an
+    extra exec of the shell and its startup.
 
     Returns a tuple of: (Popen_object, stdout_file, stderr_file)
     """
     command = job['command']
     job_id = job['id']
     
-    # Ensure log directory exists
-    os.makedirs(LOG_DIR, exist_ok=True)
+    log_out_path, log_err_path = logstore.job_log_paths(job_id, log_backend)
     
-    log_out_path = os.path.join(LOG_DIR, f"{job_id}.out.log")
-    log_err_path = os.path.join(LOG_DIR, f"{job_id}.err.log")
+    # Ensure log directory exists
+    os.makedirs(os.path.dirname(log_out_path), exist_ok=True)
     
     print(f"Worker {os.getpid()}: Starting job {job_id}: {command}")
     print(f"Worker {os.getpid()}: Stdout log: {log_out_path}")
     
+    if job.get('callable'):
+        try:
+            return runners.start(job, log_out_path, log_err_path), None, None
+        except Exception as e:
+            print(f"Worker {os.getpid()}: Job {job_id} failed to start: {e}")
+            return None, None, None
+    
     try:
         # --- MODIFIED: Redirect stdout/stderr to files ---
         # Open file handles for Popen to write to
         f_out = open(log_out_path, 'w')
         f_err = open(log_err_path, 'w')
         
-        process = subprocess.Popen(
-            command,
-            shell=True,
-            stdout=f_out,
-            stderr=f_err,
-            text=True
-        )
+        argv = _direct_argv(command) if executor == 'spawn' else None
+        if argv is not None:
+            process = subprocess.Popen(argv, stdout=f_out, stderr=f_err)
+        else:
+            process = subprocess.Popen(
+                command,
+                shell=True,
+                stdout=f_out,
+                stderr=f_err,
+                text=True
+            )
         return process, f_out, f_err
     except Exception as e:
         print(f"Worker {os.getpid()}: Job {job_id} failed to start: {e}")
@@ -50,85 +110,320 @@ def execute_job(job):
         return None, None, None
 
 
-def run_worker_loop(shutdown_event: multiprocessing.Event):
+class ExitWatch:
     """
-    The main worker loop, rewritten as a non-blocking state machine.
+    A selectable handle that becomes readable when a child process exits,
+    so the worker can block on the exit instead of polling for it.
+
+    Uses a pidfd on Linux 5.3+. Elsewhere a helper thread blocks in
+    process.wait() and signals through a socketpair.
     """
     
+    def __init__(self, process):
+        self._pidfd = None
+        self._sockets = None
+        if hasattr(os, 'pidfd_open'):
+            try:
+                self._pidfd = os.pidfd_open(process.pid)
+                return
+            except OSError:
+                pass  # Kernel without pidfd support
+        reader, writer = socket.socketpair()
+        self._sockets = (reader, writer)
+        threading.Thread(target=self._wait, args=(process, writer), daemon=True).start()
+    
+    @staticmethod
+    def _wait(process, writer):
+        process.wait()
+        try:
+            writer.send(b'!')
+        except OSError:
+            pass  # Watch already closed
+    
+    def fileno(self):
+        if self._pidfd is not None:
+            return self._pidfd
+        return self._sockets[0].fileno()
+    
+    def close(self):
+        if self._pidfd is not None:
+            os.close(self._pidfd)
+        else:
+            for sock in self._sockets:
+                sock.close()
+
+
+def _idle_timeout(queues=None):
+    """
+    Seconds an idle worker may sleep: until the next due job in its
+    queues (any queue if None), capped.
+    """
+    next_run_at = database.get_next_run_at(queues)
+    if next_run_at is None:
+        return IDLE_POLL_INTERVAL
+    delay = (next_run_at - database.now_us()) / 1_000_000
+    return min(max(delay, 0.0), IDLE_POLL_INTERVAL)
+
+
+def parse_queues(spec):
+    """
+    Parses a --queues value such as 'critical,default,bulk' or
+    'critical:6,default:3,bulk:1' into [(name, weight), ...].
+    Raises ValueError if it is malformed.
+    """
+    queues = []
+    for item in spec.split(','):
+        name, _, weight = item.strip().partition(':')
+        if not name:
+            raise ValueError(f"Empty queue name in '{spec}'.")
+        try:
+            weight = int(weight) if weight else 1
+        except ValueError:
+            raise ValueError(f"Invalid weight for queue '{name}': '{weight}'.")
+        if weight < 1:
+            raise ValueError(f"Weight for queue '{name}' must be at least 1.")
+        queues.append((name, weight))
+    return queues
+
+
+def claim_order(queues, weighted):
+    """
+    Queue names to claim from, in order. Strict mode always returns them
+    as given. Weighted mode draws the order at random, each queue coming
+    first in proportion to its weight, so a busy low-weight queue still
+    gets a share of the claims and is never starved.
+    """
+    if not weighted:
+        return [name for name, _ in queues]
+    remaining = list(queues)
+    order = []
+    while remaining:
+        pick = random.choices(remaining, weights=[weight for _, weight in remaining])[0]
+        remaining.remove(pick)
+        order.append(pick[0])
+    return order
+
+
+class _Slot:
+    """A job running in one of the worker's concurrency slots."""
+    
+    def __init__(self, job, process, stdout_file, stderr_file):
+        self.job = job
+        self.process = process
+        self.stdout_file = stdout_file
+        self.stderr_file = stderr_file
+        # A callable job signals completion on its runner's pipe
+        self.watch = process if isinstance(process, pyjobs.CallableRun) else ExitWatch(process)
+        self.timed_out = False
+        self.late_start = None  # Start time of a prefetched job, for its result
+        # time.monotonic() of the next timeout action, or None for no timeout
+        self.timeout = job.get('timeout', 300)
+        self.deadline = time.monotonic() + self.timeout if self.timeout else None
+    
+    def on_deadline(self):
+        """Escalates a job past its deadline: SIGTERM first, SIGKILL a second later."""
+        if not self.timed_out:
+            print(f"Worker {os.getpid()}: Job {self.job['id']} TIMED OUT (>{self.timeout}s). Terminating...")
+            self.timed_out = True
+            self.process.terminate()  # Send SIGTERM
+            self.deadline = time.monotonic() + 1.0  # Give it a second to die
+        else:
+            self.process.kill()  # Send SIGKILL
+            self.deadline = None
+    
+    def close(self):
+        self.watch.close()
+        if self.stdout_file: self.stdout_file.close()
+        if self.stderr_file: self.stderr_file.close()
+
+
+def run_worker_loop(shutdown_event: multiprocessing.Event, prefetch=1, concurrency=1,
+                    finalize_window=0.0, backend=None, queues=None, weighted=False,
+                    executor='shell'):
+    """
+    The main worker loop, written as a state machine that blocks on
+    events (child exit, job deadline, wakeups) rather than polling.
+
+    The worker supervises up to `concurrency` job subprocesses at once,
+    claiming new jobs as slots free up. With prefetch > 1 it also leases
+    up to `prefetch - 1` extra jobs per claim transaction into a local
+    buffer. Leased jobs that were never started are released back to
+    'pending' on shutdown, while running jobs are allowed to finish.
+
+    When a slot is free, the worker blocks on its wakeup listener (see
+    notify.py) until a job is enqueued or the next retry/scheduled job
+    in its queues falls due.
+
+    Every job the worker holds (running or buffered) is leased; the worker
+    renews those leases every lease_timeout / 3 seconds, and once per
+    lease_timeout it also reaps jobs whose leases expired because their
+    worker died.
+
+    With finalize_window > 0, results of finished jobs are buffered and
+    committed together (finalize_jobs) once the oldest has waited
+    finalize_window seconds. A buffered result is lost if the worker dies
+    before the flush; its job is still leased, so the reaper treats it
+    like any job whose worker died and counts a failed attempt. The job
+    runs again (at-least-once, as always), or goes to the DLQ if it had
+    succeeded on its last allowed attempt. Nothing is lost on a graceful
+    shutdown.
+
+    `backend` carries the worker's writes (claims, results, leases). It
+    defaults to the database module itself; `worker start --db-owner`
+    passes a dbowner.DBOwnerClient that funnels them to one writer process.
+
+    `queues` ([(name, weight), ...], see parse_queues) limits the worker to
+    those named queues, claimed in strict or (if `weighted`) weighted order;
+    by default it takes jobs from every queue.
+
+    `executor` is passed to execute_job ('shell' or 'spawn'). Python
+    callable jobs run on a pool of warm runner processes (see pyjobs.py)
+    kept for the worker's lifetime.
+
+    With the 'segments' log backend (config key 'log_backend', read at
+    startup), a finished job's output is appended to the worker's segment
+    file and its index entries ride along with the job's result into the
+    finalize transaction.
+    """
+    db = backend or database
+    listener = notify.create_listener()
+    
     def handle_signal(sig, frame):
         if not shutdown_event.is_set():
             print(f"\nWorker {os.getpid()}: Shutdown signal received...")
             shutdown_event.set()
+        if listener:
+            listener.wake()
     
     signal.signal(signal.SIGINT, handle_signal)
     signal.signal(signal.SIGTERM, handle_signal)
     
     # State variables
-    current_process: subprocess.Popen = None
-    current_job = None
-    current_job_start_time = None
-    stdout_file = None
-    stderr_file = None
+    selector = selectors.DefaultSelector()
+    if listener:
+        selector.register(listener, selectors.EVENT_READ, None)
+    running = set()  # _Slot objects
+    leased_jobs = deque()  # Claimed but not yet started
+    queue_names = [name for name, _ in queues] if queues else None
+    lease_timeout = db.get_lease_timeout()
+    next_heartbeat = time.monotonic() + lease_timeout / 3
+    next_reap = time.monotonic()  # Recover orphaned jobs right away
+    finished = []  # finalize_jobs() results awaiting a group commit
+    next_flush = None
+    runners = pyjobs.RunnerPool()
+    log_backend = logstore.get_backend()
+    segments = logstore.SegmentWriter() if log_backend == 'segments' else None
     
     while True:
+        shutting_down = shutdown_event.is_set()
+        
+        # --- Lease maintenance ---
+        now = time.monotonic()
+        if now >= next_heartbeat:
+            held = ([slot.job['id'] for slot in running] + [job['id'] for job in leased_jobs]
+                    + [result[0] for result in finished])
+            db.extend_leases(held)
+            next_heartbeat = now + lease_timeout / 3
+        if not shutting_down and now >= next_reap:
+            db.reap_expired_leases()
+            lease_timeout = db.get_lease_timeout()
+            next_reap = now + lease_timeout
+        
+        if shutting_down and leased_jobs:
+            # Hand unstarted jobs back right away so other workers can run them
+            for job in leased_jobs:
+                print(f"Worker {os.getpid()}: Releasing unstarted job {job['id']}.")
+                db.release_job(job['id'])
+            leased_jobs.clear()
+        
+        if finished and (shutting_down or now >= next_flush):
+            db.finalize_jobs(finished)
+            finished = []
+            next_flush = None
         
-        if current_process:
-            # --- STATE 1: We are currently processing a job ---
-            return_code = current_process.poll()
+        # --- Fill free slots with new jobs ---
+        while not shutting_down and len(running) < concurrency:
+            if not leased_jobs:
+                free_slots = concurrency - len(running)
+                order = claim_order(queues, weighted) if queues else None
+                leased_jobs.extend(db.fetch_and_lock_jobs(free_slots + prefetch - 1, order, free_slots))
+                if not leased_jobs:
+                    break
             
-            # --- NEW: Timeout Logic ---
-            job_timeout = current_job.get('timeout', 300)
-            if job_timeout and (time.time() - current_job_start_time) > job_timeout:
-                print(f"Worker {os.getpid()}: Job {current_job['id']} TIMED OUT (>{job_timeout}s). Terminating...")
-                current_process.terminate()  # Send SIGTERM
-                time.sleep(1)  # Give it a second to die
-                current_process.kill()  # Send SIGKILL
-                return_code = -9  # Custom timeout code
-            # --- End Timeout Logic ---
+            # Already 'processing'; started_at was set by the claim unless
+            # the job was prefetched, then it is reported with the result
+            job = leased_jobs.popleft()
+            late_start = database.now_us() if job['started_at'] is None else None
+            process, stdout_file, stderr_file = execute_job(job, executor, runners, log_backend)
+            if process is None:
+                # Job failed to even start, finalize it immediately
+                logs = segments.store(job['id']) if segments else None
+                db.finalize_job(job['id'], success=False, logs=logs, started_at=late_start,
+                                claimed_at=job['updated_at'])
+                continue
+            slot = _Slot(job, process, stdout_file, stderr_file)
+            slot.late_start = late_start
+            selector.register(slot.watch, selectors.EVENT_READ, slot)
+            running.add(slot)
+        
+        if shutting_down and not running:
+            break
+        
+        # --- Block until a child exits, a timer fires, or we are woken ---
+        now = time.monotonic()
+        timers = [slot.deadline - now for slot in running if slot.deadline is not None]
+        if running or leased_jobs:
+            timers.append(next_heartbeat - now)
+        if finished:
+            timers.append(next_flush - now)
+        if not shutting_down:
+            timers.append(next_reap - now)
+            if len(running) < concurrency:
+                timers.append(_idle_timeout(queue_names) if listener else 1.0)
+        timeout = max(min(timers), 0.0) if timers else None
+        
+        if not running and not listener:
+            # Nothing to select on: plain polling fallback
+            shutdown_event.wait(timeout=timeout)
+            continue
+        
+        for key, _ in selector.select(timeout):
+            if key.data is None:
+                listener.drain()
+                continue
             
-            if return_code is not None:
-                # --- Job just finished ---
-                print(f"Worker {os.getpid()}: Job {current_job['id']} finished with code {return_code}.")
-                
-                # Close log file handles
-                if stdout_file: stdout_file.close()
-                if stderr_file: stderr_file.close()
-                
-                # Finalize the job in the DB
-                database.finalize_job(current_job['id'], success=(return_code == 0))
-                
-                # Reset state to idle
-                current_process = None
-                current_job = None
-                current_job_start_time = None
+            # --- Job just finished ---
+            slot = key.data
+            return_code = slot.process.wait()  # Reap; returns at once
+            if slot.timed_out:
+                return_code = -9  # Custom timeout code
+            print(f"Worker {os.getpid()}: Job {slot.job['id']} finished with code {return_code}.")
             
-            else:
-                # --- Job is still running ---
-                shutdown_event.wait(timeout=0.1)
-        
-        elif not shutdown_event.is_set():
-            # --- STATE 2: We are idle and not shutting down ---
-            job_dict = database.fetch_and_lock_job()
+            selector.unregister(slot.watch)
+            running.discard(slot)
+            slot.close()
+            logs = segments.store(slot.job['id']) if segments else None
             
-            if job_dict:
-                # --- Found a job, start it ---
-                current_job = job_dict  # Save the full job dict
-                database.mark_job_started(current_job['id'])  # Mark start time
-                
-                current_process, stdout_file, stderr_file = execute_job(current_job)
-                current_job_start_time = time.time()
-                
-                if current_process is None:
-                    # Job failed to even start, finalize it immediately
-                    database.finalize_job(current_job['id'], success=False)
-                    current_job = None
-                    current_job_start_time = None
+            # Finalize the job in the DB, now or with the next group
+            if finalize_window > 0:
+                if not finished:
+                    next_flush = time.monotonic() + finalize_window
+                finished.append((slot.job['id'], return_code == 0, logs, slot.late_start,
+                                 slot.job['updated_at']))
             else:
-                # --- No job found, sleep ---
-                shutdown_event.wait(timeout=1.0)
+                db.finalize_job(slot.job['id'], success=(return_code == 0), logs=logs,
+                                started_at=slot.late_start, claimed_at=slot.job['updated_at'])
         
-        else:
-            # --- STATE 3: We are idle AND shutting down ---
-            break
+        # --- Timeout Logic ---
+        now = time.monotonic()
+        for slot in running:
+            if slot.deadline is not None and now >= slot.deadline:
+                slot.on_deadline()
     
+    runners.close()
+    if segments:
+        segments.close()
+    selector.close()
+    if listener:
+        listener.close()
     print(f"Worker {os.getpid()}: Exiting.")
@@ -258,4 +258,24 @@ else
     fi
 fi
 
+# --- SCENARIO 8: Bulk Enqueue with Bad Rows ---
+echo "--- SCENARIO 8: Bulk Enqueue with Bad Rows ---"
+echo "Enqueuing 4 lines from stdin (2 valid, 1 non-string command, 1 duplicate)..."
+BULK_OUTPUT=$(printf '%s\n' \
+    '{"id": "job-bulk-1", "command": "echo bulk 1"}' \
+    '{"id": "job-bulk-bad", "command": ["echo"]}' \
+    '{"id": "job-bulk-2", "command": "echo bulk 2"}' \
+    '{"id": "job-bulk-1", "command": "echo bulk 1 again"}' | queuectl enqueue --stdin)
+echo "$BULK_OUTPUT"
+if ! echo "$BULK_OUTPUT" | grep -q "Enqueued 2 job(s)"; then
+    echo "!!! TEST FAILED: Expected the 2 valid rows to be enqueued."
+    exit 1
+fi
+BULK_COUNT=$(sqlite3 queue.db "SELECT COUNT(*) FROM jobs WHERE id IN ('job-bulk-1', 'job-bulk-2');")
+if [ "$BULK_COUNT" -ne 2 ]; then
+    echo "!!! TEST FAILED: Expected 2 bulk jobs in the queue, found $BULK_COUNT."
+    exit 1
+fi
+echo "✅ Bad rows were reported and skipped; valid rows were enqueued."
+
 echo "--- ALL TESTS PASSED ---"